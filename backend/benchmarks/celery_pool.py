@@ -0,0 +1,206 @@
+# 이미지 생성 파이프라인(번역 -> 이미지 생성 -> 다운로드 -> S3 업로드)을
+# Celery prefork 풀과 gevent 풀에서 돌려 처리량을 비교한다.
+# 외부 API(Papago, OpenAI, S3)는 응답마다 --latency 초를 기다리는 로컬 스텁 서버로 대신한다.
+#
+#   cd backend
+#   python benchmarks/celery_pool.py --pool prefork --concurrency 4
+#   python benchmarks/celery_pool.py --pool gevent --concurrency 100
+import sys
+
+# gevent는 다른 모듈을 import 하기 전에 패치해야 한다. (celery -P gevent 와 같은 순서)
+if "--pool" in sys.argv and sys.argv[sys.argv.index("--pool") + 1] == "gevent":
+    from gevent import monkey
+
+    monkey.patch_all()
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(256) * 64
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 동시 접속이 몰려도 연결이 거절되지 않도록 백로그를 늘린다.
+    request_queue_size = 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self):
+        # OpenAI가 준 이미지 URL 다운로드
+        time.sleep(self.latency)
+        self.reply(PNG, "image/png")
+
+    def do_POST(self):
+        body = self.read_body().decode()
+        time.sleep(self.latency)
+        if self.path.startswith("/v1/images/generations"):
+            url = "http://%s:%d/image.png" % self.server.server_address
+            self.reply(
+                json.dumps({"created": 0, "data": [{"url": url}]}).encode(), "application/json"
+            )
+        else:
+            # Papago: 받은 텍스트를 그대로 돌려준다.
+            from urllib.parse import parse_qs
+
+            text = parse_qs(body)["text"][0]
+            data = {"message": {"result": {"translatedText": text}}}
+            self.reply(json.dumps(data).encode(), "application/json")
+
+    def do_PUT(self):
+        # S3 PutObject
+        self.read_body()
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("ETag", '"stub"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def read_body(self):
+        if "Content-Length" in self.headers:
+            return self.rfile.read(int(self.headers["Content-Length"]))
+
+        body = b""
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            if size == 0:
+                return body
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_stub(latency):
+    StubHandler.latency = latency
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def start_stub(latency):
+    # 벤치마크 프로세스(gevent 패치, 풀 프로세스)와 분리된 별도 프로세스에서 띄운다.
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--stub", "--latency", str(latency)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return process, int(process.stdout.readline())
+
+
+def setup_django(port, concurrency):
+    base = "http://127.0.0.1:%d" % port
+    os.environ.update(
+        {
+            "USE_SQLITE": "true",
+            "SECRET_KEY": os.getenv("SECRET_KEY", "benchmark"),
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_API_BASE": base + "/v1",
+            "PAPAGO_URL": base + "/papago",
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+            "AWS_STORAGE_BUCKET_NAME": "benchmark",
+            "AWS_S3_REGION_NAME": "us-east-1",
+            "AWS_S3_ENDPOINT_URL": base,
+            "EXTERNAL_API_POOL_SIZE": str(concurrency),
+            # 풀 자체의 처리량을 재므로 OpenAI 한도는 두지 않는다.
+            "IMAGE_RATE_LIMIT": "1000000",
+        }
+    )
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import django
+
+    django.setup()
+
+
+def run_pipeline(i):
+    from myapp.tasks import create_image, translate_text
+
+    # 태스크 안에서 난 오류는 (실패, 소요 시간)으로 돌려준다.
+    start = time.monotonic()
+    try:
+        result = create_image(translate_text("벤치마크 %d %d" % (os.getpid(), i)))
+    except Exception as e:
+        result = {"error": str(e)}
+    return "error" not in result, time.monotonic() - start
+
+
+def run(pool_name, concurrency, tasks):
+    from celery.concurrency import get_implementation
+    from config.celery import app
+
+    # 워커(celery worker)가 풀을 만드는 것과 같은 인자로 만든다.
+    pool = get_implementation(pool_name)(limit=concurrency, initargs=(app, "benchmark"))
+    pool.start()
+
+    latencies = []
+    errors = []
+    finished = threading.Event()
+
+    def on_done(value):
+        ok, latency = value
+        (latencies if ok else errors).append(latency)
+        if len(latencies) + len(errors) == tasks:
+            finished.set()
+
+    start = time.monotonic()
+    for i in range(tasks):
+        pool.apply_async(run_pipeline, args=(i,), callback=on_done)
+    finished.wait()
+    elapsed = time.monotonic() - start
+    pool.stop()
+
+    latencies.sort()
+    print(
+        "pool=%s concurrency=%d tasks=%d errors=%d" % (pool_name, concurrency, tasks, len(errors))
+    )
+    print("elapsed=%.2fs throughput=%.1f tasks/s" % (elapsed, len(latencies) / elapsed))
+    if latencies:
+        print(
+            "latency p50=%.3fs p95=%.3fs"
+            % (statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1])
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pool", choices=["prefork", "gevent"], default="prefork")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="스텁 API 응답 지연(초)")
+    parser.add_argument("--stub", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        serve_stub(args.latency)
+        return
+
+    stub, port = start_stub(args.latency)
+    try:
+        setup_django(port, args.concurrency)
+        run(args.pool, args.concurrency, args.tasks)
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
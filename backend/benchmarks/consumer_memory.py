@@ -0,0 +1,113 @@
+# 웹소켓 연결 하나가 차지하는 메모리 측정
+# Channels의 WebsocketCommunicator로 가짜 소켓 --sockets개를 열고 (방마다 최대 인원까지 채움)
+# 연결 전후의 tracemalloc 차이를 연결 수로 나눈다.
+# total은 테스트 클라이언트와 Channels/asyncio 큐 몫까지 포함한 값이고, myapp은 이 저장소 코드를 거쳐 할당된 몫이다.
+#
+#   cd backend
+#   python benchmarks/consumer_memory.py --sockets 3000
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("USE_SQLITE", "true")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django
+
+django.setup()
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.db import connection
+from myapp.models import Room
+from myapp.room_state import RoomState
+from myapp.routing import websocket_urlpatterns
+
+application = URLRouter(websocket_urlpatterns)
+APP_DIR = os.path.dirname(sys.modules["myapp"].__file__)
+
+
+# 마이그레이션 파일 없이 메모리 DB에 테이블을 만든다.
+@sync_to_async
+def create_tables():
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config("myapp").get_models():
+            editor.create_model(model)
+
+
+@sync_to_async
+def create_room():
+    room = Room.objects.create()
+    RoomState(room.id).mark_exists()
+    return room.id
+
+
+async def open_socket(room_id):
+    communicator = WebsocketCommunicator(application, f"/ws/room/{room_id}/")
+    connected, _ = await communicator.connect(timeout=10)
+    assert connected
+    while (await communicator.receive_json_from(timeout=10)).get("event") != "connected":
+        pass
+    return communicator
+
+
+async def open_sockets(count):
+    communicators = []
+    while len(communicators) < count:
+        room_id = await create_room()
+        for _ in range(min(Room.MAX_PLAYERS, count - len(communicators))):
+            communicators.append(await open_socket(room_id))
+    return communicators
+
+
+def snapshot():
+    gc.collect()
+    return tracemalloc.take_snapshot()
+
+
+# myapp 코드를 거쳐 할당된 메모리 (컨슈머 속성, 방 상태, 보낸 메시지 등)
+def app_bytes(snapshot):
+    app_filter = tracemalloc.Filter(True, os.path.join(APP_DIR, "*"), all_frames=True)
+    return sum(stat.size for stat in snapshot.filter_traces([app_filter]).statistics("filename"))
+
+
+async def run(sockets):
+    await create_tables()
+
+    # import, 캐시 등 처음 한 번만 생기는 것은 빼고 잰다.
+    for communicator in await open_sockets(Room.MAX_PLAYERS):
+        await communicator.disconnect()
+
+    tracemalloc.start(25)
+    before = snapshot()
+    communicators = await open_sockets(sockets)
+    await asyncio.sleep(0.5)
+    after = snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    app = app_bytes(after) - app_bytes(before)
+    print("sockets: %d" % sockets)
+    print("total: %.1f MiB (%.0f bytes/connection)" % (total / 2**20, total / sockets))
+    print("myapp: %.1f MiB (%.0f bytes/connection)" % (app / 2**20, app / sockets))
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sockets", type=int, default=3000)
+    args = parser.parse_args()
+    asyncio.run(run(args.sockets))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# 게임 한 판 전체(입장 -> startGame -> 라운드마다 inputTitle / 이미지 / next_round -> 결과)를 돌리는 부하 측정
+# --games개 방에 방마다 --players명이 Channels의 WebsocketCommunicator로 동시에 접속해 끝까지 플레이한다.
+# 회귀 기준값으로 쓸 수 있도록 아래 값을 출력한다.
+#   connect: 접속부터 connected 이벤트까지 걸린 시간
+#   round transition: 라운드의 마지막 inputTitle부터 각 플레이어가 다음 라운드(moveNextRound / end)를 받기까지
+#   queries/round, group_send/round, delivered/round: 게임 진행 중 한 라운드에 드는 DB 쿼리 / 채널 레이어 메시지 수
+#
+# 오프라인으로 돈다. (USE_SQLITE 설정: sqlite 메모리 DB, 로컬 메모리 캐시, InMemoryChannelLayer)
+# 외부 API(Papago, OpenAI, S3)는 celery_pool.py의 스텁 서버를 서비스별 지연(--*-latency)으로 띄워 대신하고,
+# Celery 워커 대신 이벤트 루프의 스레드 풀(--workers)에서 태스크를 실행한다.
+#
+#   cd backend
+#   python benchmarks/game_flow.py --games 20
+#   python benchmarks/game_flow.py --games 50 --openai-latency 2 --json baseline.json
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from celery_pool import StubHandler, StubServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GameStubHandler(StubHandler):
+    latencies = {"openai": 0.0, "papago": 0.0, "s3": 0.0}
+
+    # 이미지 생성은 OpenAI, 번역은 Papago, 이미지 다운로드/업로드는 S3 지연을 쓴다.
+    @property
+    def latency(self):
+        if self.command == "POST":
+            return self.latencies["openai" if self.path.startswith("/v1/") else "papago"]
+        return self.latencies["s3"]
+
+
+def start_stub(latencies):
+    GameStubHandler.latencies = latencies
+    server = StubServer(("127.0.0.1", 0), GameStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+def setup_django(port, workers):
+    base = "http://127.0.0.1:%d" % port
+    os.environ.update(
+        {
+            "USE_SQLITE": "true",
+            "SECRET_KEY": os.getenv("SECRET_KEY", "benchmark"),
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_API_BASE": base + "/v1",
+            "PAPAGO_URL": base + "/papago",
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+            "AWS_STORAGE_BUCKET_NAME": "benchmark",
+            "AWS_S3_REGION_NAME": "us-east-1",
+            "AWS_S3_ENDPOINT_URL": base,
+            "EXTERNAL_API_POOL_SIZE": str(workers),
+            # 게임 흐름을 재므로 OpenAI 한도는 두지 않는다.
+            "IMAGE_RATE_LIMIT": "1000000",
+        }
+    )
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+    import django
+    from django.conf import settings
+
+    # 태스크를 실행하는 스레드들도 같은 메모리 DB를 보도록 공유 캐시로 연다. (앱 초기화 중에 DB에 접속하므로 setup 전에)
+    settings.DATABASES["default"]["NAME"] = "file:game_flow?mode=memory&cache=shared"
+    # 로컬 메모리 캐시는 기본 300개가 넘으면 키를 지우므로 Redis처럼 지워지지 않게 늘린다.
+    settings.CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 10**7}
+    django.setup()
+
+    # eager 실행에서는 재시도가 countdown 없이 바로 다시 실행되므로 방별 동시 생성 한도도 푼다.
+    settings.ROOM_IMAGE_IN_FLIGHT = 1000
+
+
+# 지금 실행 중인 코드가 어느 게임의 것인지 (컨슈머, 코디네이터, 태스크 스레드까지 이어진다)
+current_game = contextvars.ContextVar("current_game", default=None)
+
+
+class Game:
+    def __init__(self, number, players):
+        self.number = number
+        self.players = players
+        self.phase = "connect"
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.connect_latencies = []
+        self.transition_latencies = []
+        self.submitted = {}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[self.phase, name] += 1
+
+
+def count(name):
+    game = current_game.get()
+    if game is not None:
+        game.count(name)
+
+
+def count_query(execute, sql, params, many, context):
+    count("queries")
+    return execute(sql, params, many, context)
+
+
+def install_counters():
+    from channels.layers import get_channel_layer
+    from django.db.backends.signals import connection_created
+
+    def on_connection_created(sender, connection, **kwargs):
+        # 쓰기는 한 스레드(sync_to_async)에서만 일어나므로 읽기 스레드가 테이블 잠금에 걸리지 않게 한다.
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA read_uncommitted = 1")
+        connection.execute_wrappers.append(count_query)
+
+    connection_created.connect(on_connection_created, weak=False)
+
+    layer = get_channel_layer()
+    send, group_send = layer.send, layer.group_send
+
+    async def counting_send(channel, message):
+        count("delivered")
+        return await send(channel, message)
+
+    async def counting_group_send(group, message):
+        count("group_send")
+        return await group_send(group, message)
+
+    layer.send, layer.group_send = counting_send, counting_group_send
+
+
+def install_worker(loop):
+    from asgiref.sync import sync_to_async
+    from config.celery import app
+    from myapp import consumers, tasks
+
+    # 태스크 안에서 보내는 group(라운드 이미지)도 바로 실행한다.
+    app.conf.task_always_eager = True
+
+    # 컨슈머의 sync_to_async 스레드를 막지 않고 스레드 풀에서 태스크(체인)를 끝까지 실행한다.
+    # apply_async(eager)는 프로세스 전역 플래그로 result.get()을 막아 다른 스레드의 체인이 실패하므로 apply()로 실행한다.
+    def in_worker(signature):
+        def dispatch(*args):
+            asyncio.run_coroutine_threadsafe(
+                sync_to_async(lambda: signature(*args).apply(), thread_sensitive=False)(), loop
+            )
+            return SimpleNamespace(id=str(uuid.uuid4()))
+
+        return dispatch
+
+    consumers.start_image_pipeline = in_worker(
+        lambda *args: tasks.image_pipeline(*args, prefetch=True)
+    )
+    consumers.generate_round_images = SimpleNamespace(
+        delay=in_worker(tasks.generate_round_images.s)
+    )
+
+
+def create_tables():
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config("myapp").get_models():
+            editor.create_model(model)
+
+
+def create_room():
+    from myapp.models import Room
+    from myapp.room_state import RoomState
+
+    room = Room.objects.create()
+    RoomState(room.id).mark_exists()
+    return room.id
+
+
+async def wait_event(communicator, *events, timeout=60):
+    while True:
+        message = await communicator.receive_json_from(timeout=timeout)
+        event = message.get("event")
+        # 프론트엔드처럼 코디네이터의 ping에 답해야 방에서 내보내지지 않는다.
+        if event == "ping":
+            await communicator.send_json_to({"event": "pong", "data": "pong"})
+        if event in ("error", "image_creation_failed"):
+            raise RuntimeError(message)
+        if event in events:
+            return message
+
+
+# WebsocketCommunicator는 빈 컨텍스트에서 앱을 실행하므로 앱 안에서 게임을 표시한다.
+def game_application(application, game):
+    async def app(scope, receive, send):
+        current_game.set(game)
+        return await application(scope, receive, send)
+
+    return app
+
+
+async def connect(application, game, room_id):
+    from channels.testing import WebsocketCommunicator
+
+    start = time.monotonic()
+    communicator = WebsocketCommunicator(application, f"/ws/room/{room_id}/")
+    connected, _ = await communicator.connect(timeout=10)
+    assert connected
+    message = await wait_event(communicator, "connected")
+    game.connect_latencies.append(time.monotonic() - start)
+    return communicator, message["data"]["playerId"]
+
+
+async def play(game, communicator, player_id):
+    await wait_event(communicator, "gameStart")
+    for round in range(1, game.players + 1):
+        if round > 1:
+            await wait_event(communicator, "moveNextRound")
+            game.transition_latencies.append(time.monotonic() - game.submitted[round - 1])
+
+        title = "게임 %d 플레이어 %d 라운드 %d" % (game.number, player_id, round)
+        game.submitted[round] = time.monotonic()
+        await communicator.send_json_to(
+            {"event": "inputTitle", "data": {"title": title, "playerId": player_id}}
+        )
+
+    await wait_event(communicator, "end")
+    game.transition_latencies.append(time.monotonic() - game.submitted[game.players])
+
+
+async def run_game(application, number, players):
+    from asgiref.sync import sync_to_async
+
+    game = Game(number, players)
+    current_game.set(game)
+    application = game_application(application, game)
+
+    room_id = await sync_to_async(create_room)()
+    sockets = await asyncio.gather(*[connect(application, game, room_id) for _ in range(players)])
+
+    game.phase = "play"
+    await sockets[0][0].send_json_to({"event": "startGame"})
+    await asyncio.gather(
+        *[play(game, communicator, player_id) for communicator, player_id in sockets]
+    )
+
+    game.phase = "result"
+    for communicator, player_id in sockets:
+        await communicator.send_json_to({"event": "wantResult", "data": {"playerId": player_id}})
+    for communicator, _ in sockets:
+        await wait_event(communicator, "gameResult")
+
+    game.phase = "disconnect"
+    for communicator, _ in sockets:
+        await communicator.disconnect()
+    return game
+
+
+def percentiles(values):
+    values = sorted(values)
+    return "p50=%.3fs p95=%.3fs max=%.3fs" % (
+        statistics.median(values),
+        values[max(int(len(values) * 0.95) - 1, 0)],
+        values[-1],
+    )
+
+
+async def run(games, players, workers):
+    from asgiref.sync import sync_to_async
+    from channels.routing import URLRouter
+    from myapp.routing import websocket_urlpatterns
+
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(workers))
+    install_counters()
+    install_worker(loop)
+    await sync_to_async(create_tables)()
+    application = URLRouter(websocket_urlpatterns)
+
+    start = time.monotonic()
+    results = await asyncio.gather(
+        *[run_game(application, number, players) for number in range(games)]
+    )
+    elapsed = time.monotonic() - start
+
+    counts = sum((game.counts for game in results), Counter())
+    rounds = games * players
+    sockets = games * players
+    summary = {
+        "games": games,
+        "players": players,
+        "elapsed": elapsed,
+        "connect": [latency for game in results for latency in game.connect_latencies],
+        "round_transition": [latency for game in results for latency in game.transition_latencies],
+        "queries_per_connect": counts["connect", "queries"] / sockets,
+        "queries_per_round": counts["play", "queries"] / rounds,
+        "group_send_per_round": counts["play", "group_send"] / rounds,
+        "delivered_per_round": counts["play", "delivered"] / rounds,
+        "queries_per_result": counts["result", "queries"] / games,
+        "queries_per_disconnect": counts["disconnect", "queries"] / sockets,
+    }
+
+    print("games=%d players=%d elapsed=%.2fs" % (games, players, elapsed))
+    print("connect: %s" % percentiles(summary["connect"]))
+    print("round transition: %s" % percentiles(summary["round_transition"]))
+    print(
+        "per round: queries=%.1f group_send=%.1f delivered=%.1f"
+        % (
+            summary["queries_per_round"],
+            summary["group_send_per_round"],
+            summary["delivered_per_round"],
+        )
+    )
+    print(
+        "queries: connect=%.1f/socket result=%.1f/game disconnect=%.1f/socket"
+        % (
+            summary["queries_per_connect"],
+            summary["queries_per_result"],
+            summary["queries_per_disconnect"],
+        )
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument(
+        "--workers", type=int, default=16, help="태스크를 실행하는 스레드 수 (Celery 워커 동시성)"
+    )
+    parser.add_argument(
+        "--openai-latency", type=float, default=0.5, help="OpenAI 이미지 생성 응답 지연(초)"
+    )
+    parser.add_argument(
+        "--papago-latency", type=float, default=0.05, help="Papago 번역 응답 지연(초)"
+    )
+    parser.add_argument(
+        "--s3-latency", type=float, default=0.05, help="이미지 다운로드/S3 업로드 지연(초)"
+    )
+    parser.add_argument("--json", help="결과를 저장할 파일 (회귀 비교용)")
+    args = parser.parse_args()
+
+    port = start_stub(
+        {"openai": args.openai_latency, "papago": args.papago_latency, "s3": args.s3_latency}
+    )
+    setup_django(port, args.workers)
+    summary = asyncio.run(run(args.games, args.players, args.workers))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+from channels_redis.core import RedisChannelLayer
+
+
+# 방 단위 고정 라우팅(ROOM_AFFINITY)용 채널 레이어
+# nginx가 같은 방의 웹소켓을 같은 워커 프로세스로 보내므로, 그룹 멤버 대부분이 이 프로세스의 채널이다.
+# group_send 때 이 프로세스의 채널에는 Redis를 거치지 않고 바로 수신 버퍼에 넣고,
+# 다른 프로세스/노드의 채널(재시작, 노드 추가 등으로 라우팅이 바뀐 경우)에만 기존처럼 Redis로 보낸다.
+# 그룹 멤버 목록은 계속 Redis에 있으므로 어느 쪽이든 메시지가 빠지지 않는다.
+# channels_redis 내부 메서드(_map_channel_keys_to_connection, receive_single)를 재정의하므로
+# 버전을 올릴 때는 Pipfile의 고정 버전과 함께 확인한다.
+class RoomAffinityChannelLayer(RedisChannelLayer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Redis에서 꺼내는 중인 작업 (로컬 메시지로 깨어나도 취소하지 않고 다음 receive가 이어받는다)
+        self.pending_receive = None
+        # 로컬 메시지가 왔을 때 receive를 깨우는 이벤트와 그 이벤트를 만든 루프
+        self.wakeup = None
+        self.wakeup_loop = None
+
+    def is_local(self, channel):
+        return "!" in channel and self.non_local_name(channel).endswith(self.client_prefix + "!")
+
+    def wakeup_event(self):
+        loop = asyncio.get_running_loop()
+        if self.wakeup is None or self.wakeup_loop is not loop:
+            self.wakeup, self.wakeup_loop = asyncio.Event(), loop
+        return self.wakeup
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        # 수신 버퍼는 receive 중인 이벤트 루프에서만 건드릴 수 있다.
+        try:
+            same_loop = asyncio.get_running_loop() is self.receive_event_loop
+        except RuntimeError:
+            same_loop = False
+
+        if same_loop:
+            local = [channel for channel in channel_names if self.is_local(channel)]
+            if local:
+                # Redis 경로와 마찬가지로 같은 프로세스의 채널들은 메시지 객체 하나를 같이 받는다.
+                message = dict(message)
+                for channel in local:
+                    self.receive_buffer[channel].put_nowait(message)
+                # Redis를 기다리며 receive 락을 잡고 있는 컨슈머도 깨운다.
+                self.wakeup_event().set()
+                channel_names = [channel for channel in channel_names if not self.is_local(channel)]
+
+        return super()._map_channel_keys_to_connection(channel_names, message)
+
+    async def receive_single(self, channel):
+        if not channel.endswith(self.client_prefix + "!"):
+            return await super().receive_single(channel)
+
+        loop = asyncio.get_running_loop()
+        if self.pending_receive is None or self.pending_receive.get_loop() is not loop:
+            self.pending_receive = asyncio.ensure_future(super().receive_single(channel))
+
+        wakeup = self.wakeup_event()
+        waiter = asyncio.ensure_future(wakeup.wait())
+        try:
+            await asyncio.wait([self.pending_receive, waiter], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        wakeup.clear()
+
+        if self.pending_receive.done():
+            task, self.pending_receive = self.pending_receive, None
+            return task.result()
+        # 로컬 메시지로 깨어난 경우: 받은 채널 없음 (receive가 자기 버퍼를 다시 확인한다)
+        return [], None
+
+    async def flush(self):
+        if self.pending_receive is not None:
+            if self.pending_receive.get_loop() is asyncio.get_running_loop():
+                self.pending_receive.cancel()
+            self.pending_receive = None
+        await super().flush()
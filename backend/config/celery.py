@@ -1,12 +1,21 @@
 import os
 from celery import Celery
+from celery.signals import worker_init
 
 # 기본 장고파일 설정
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-app = Celery("config",
-             backend=f"rpc://{os.getenv('AWS_REDIS_HOST', 'redis')}:6379/",
-             include=["myapp.tasks"])
+app = Celery(
+    "config", backend=f"rpc://{os.getenv('AWS_REDIS_HOST', 'redis')}:6379/", include=["myapp.tasks"]
+)
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # 등록된 장고 앱 설정에서 task 불러오기
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def configure_translation(sender, **kwargs):
+    # 풀 종류와 동시성에 맞춰 번역 묶음 요청을 켜고 끈다.
+    from myapp.translation import configure_worker
+
+    configure_worker(sender.pool_cls, sender.concurrency)
@@ -0,0 +1,36 @@
+# 채널 레이어(Redis) 설정
+# - hosts: "host:port,host:port" 처럼 여러 개를 주면 channels_redis가 채널/그룹 이름의 해시로
+#   샤드를 골라 나눠 저장한다. group_send는 샤드마다 Lua 스크립트 한 번으로 그룹 전체에 보낸다.
+# - backend: "core" (Redis 리스트 기반, 기본) / "pubsub" (Redis Pub/Sub 기반, 메시지를 Redis에 쌓지 않음)
+#   / "affinity" (core + 같은 프로세스 채널은 Redis를 거치지 않음, config/affinity.py)
+# - max_connections: 샤드마다의 커넥션 풀 크기 (redis-py 기본값 100을 넘는 동시 group_send가 있으면 늘린다)
+# - capacity: core 백엔드에서 채널마다 쌓아둘 수 있는 메시지 수. 한 프로세스의 채널들은 모두
+#   같은 키("specific.<프로세스>!")를 쓰기 때문에 사실상 프로세스 단위 한도다.
+#   넘친 group_send 메시지는 경고 로그만 남기고 버려지므로 방이 많으면 기본값(100)보다 크게 잡는다.
+BACKENDS = {
+    "core": "channels_redis.core.RedisChannelLayer",
+    "pubsub": "channels_redis.pubsub.RedisPubSubChannelLayer",
+    "affinity": "config.affinity.RoomAffinityChannelLayer",
+}
+
+
+def parse_hosts(value, default_port=6379, max_connections=None):
+    hosts = []
+    for item in value.split(","):
+        host, _, port = item.strip().partition(":")
+        if not host:
+            continue
+        entry = {"host": host, "port": int(port or default_port)}
+        if max_connections:
+            entry["max_connections"] = max_connections
+        hosts.append(entry)
+    return hosts
+
+
+def redis_channel_layer(hosts, backend="core", max_connections=None, capacity=None, **config):
+    if backend != "pubsub" and capacity:
+        config["capacity"] = capacity
+    return {
+        "BACKEND": BACKENDS[backend],
+        "CONFIG": {"hosts": parse_hosts(hosts, max_connections=max_connections), **config},
+    }
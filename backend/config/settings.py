@@ -3,6 +3,7 @@ import sys
 from dotenv import load_dotenv
 from pathlib import Path
 from celery.schedules import crontab
+from config.channel_layers import redis_channel_layer
 import pymysql
 
 pymysql.install_as_MySQLdb()
@@ -166,14 +167,85 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [(os.getenv("AWS_REDIS_HOST", "redis"), 6379)],
+if os.getenv("USE_SQLITE", "false") == "true":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": f"redis://{os.getenv('AWS_REDIS_HOST', 'redis')}:6379/1",
+        }
+    }
+
+# 방 상태(플레이어, 라운드, 주제)를 캐시에 보관하는 시간(초)
+ROOM_STATE_TIMEOUT = 60 * 60 * 6
+
+# 다음 라운드 이미지가 준비되기를 기다리는 최대 시간(초)
+IMAGE_READY_TIMEOUT = 60
+# 제목이 제출되는 즉시 이미지 생성을 시작한다. (라운드가 끝날 때 대부분 완료되어 있다)
+IMAGE_PREFETCH = os.getenv("IMAGE_PREFETCH", "true") == "true"
+
+# 생성 이미지 크기, 같은 프롬프트 이미지 재사용 캐시 보관 시간(초, 적중 시 연장)
+IMAGE_SIZE = "256x256"
+# "url": OpenAI가 준 URL에서 받아 S3로 스트리밍, "b64_json": 응답에 담긴 이미지를 바로 업로드
+IMAGE_RESPONSE_FORMAT = os.getenv("IMAGE_RESPONSE_FORMAT", "url")
+IMAGE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# OpenAI 이미지 생성 한도: IMAGE_RATE_PERIOD초 동안 IMAGE_RATE_LIMIT장 (모든 워커 합산)
+IMAGE_RATE_LIMIT = int(os.getenv("IMAGE_RATE_LIMIT", "50"))
+IMAGE_RATE_PERIOD = 60
+# 방 하나에서 동시에 만드는 이미지 수
+ROOM_IMAGE_IN_FLIGHT = 3
+
+# 외부 API(OpenAI, Papago, S3) 커넥션 풀 크기.
+# 태스크는 모두 외부 API 응답을 기다리는 I/O 작업이라 워커는 gevent 풀로 띄운다.
+#   celery -A config worker -P gevent -c 100
+# 풀 크기는 워커 동시성(-c)과 같게 맞춘다. (python benchmarks/celery_pool.py 로 prefork와 비교)
+EXTERNAL_API_POOL_SIZE = int(os.getenv("EXTERNAL_API_POOL_SIZE", "10"))
+# S3 호환 스토리지(MinIO, 벤치마크용 스텁) 주소. 비워두면 AWS S3
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+
+# Papago 번역: 요청 주소, 묶어서 요청하는 대기 시간(초)과 최대 개수, 결과 캐시 크기/보관 시간(초)
+# (묶음 요청은 gevent처럼 한 프로세스가 여러 태스크를 동시에 실행하는 워커에서만 쓴다)
+PAPAGO_URL = os.getenv("PAPAGO_URL", "https://openapi.naver.com/v1/papago/n2mt")
+TRANSLATION_BATCH_WINDOW = 0.05
+TRANSLATION_BATCH_SIZE = 20
+TRANSLATION_LRU_SIZE = 1024
+TRANSLATION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# 방 코디네이터가 ping / gameProgress를 보내는 주기(초)
+ROOM_PING_INTERVAL = 10
+ROOM_STATUS_INTERVAL = 3
+# 이 시간(초) 동안 ping/pong이 없는 플레이어는 코디네이터가 방에서 내보낸다.
+# 코디네이터가 없는 동안에는 클라이언트가 50초마다 보내는 ping만 오므로 그보다 길게 둔다.
+PRESENCE_TIMEOUT = 75
+# 주제(Topic) 변경을 모아서 DB에 쓰는 주기(초). 코디네이터가 없는 방은 flush_pending_topics가 처리한다.
+TOPIC_FLUSH_INTERVAL = 5
+# msgpack 클라이언트에게 보낼 이벤트를 모아 한 프레임으로 보내는 대기 시간(초)
+WS_COALESCE_WINDOW = 0.01
+# 방 단위 고정 라우팅: nginx가 roomid 해시로 워커 프로세스를 고르고(gunicorn.conf.py),
+# 같은 프로세스에 모인 컨슈머끼리는 group_send를 Redis 없이 주고받는다.
+ROOM_AFFINITY = os.getenv("ROOM_AFFINITY", "false") == "true"
+
+if os.getenv("USE_SQLITE", "false") == "true":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
         },
-    },
-}
+    }
+else:
+    # 노드가 많아지면 CHANNEL_REDIS_HOSTS에 Redis 샤드를 여러 개 준다. ("host:port,host:port")
+    CHANNEL_LAYERS = {
+        "default": redis_channel_layer(
+            os.getenv("CHANNEL_REDIS_HOSTS", os.getenv("AWS_REDIS_HOST", "redis")),
+            os.getenv("CHANNEL_LAYER_BACKEND", "affinity" if ROOM_AFFINITY else "core"),
+            max_connections=int(os.getenv("CHANNEL_REDIS_MAX_CONNECTIONS", "500")),
+            capacity=int(os.getenv("CHANNEL_LAYER_CAPACITY", "1000")),
+        ),
+    }
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -196,7 +268,8 @@ CORS_ALLOW_HEADERS = (
 
 CORS_ALLOW_METHODS = ("POST",)
 
-PROMETHEUS_METRICS_EXPORT_PORT_RANGE = range(8001, 8050)
+# 워커 프로세스마다 지표를 따로 내보내는 포트 (8001~는 ROOM_AFFINITY 워커 포트와 겹치므로 피한다)
+PROMETHEUS_METRICS_EXPORT_PORT_RANGE = range(8101, 8150)
 
 PROMETHEUS_EXPORT_MIGRATIONS = True
 
@@ -207,6 +280,19 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# 큐 분리: 번역(translate)이 이미지 생성(images) 뒤에 밀리지 않도록 워커를 따로 띄운다.
+#   celery -A config worker -Q celery,translate,maintenance
+#   celery -A config worker -Q images
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_ROUTES = {
+    "myapp.tasks.translate_text": {"queue": "translate"},
+    "myapp.tasks.create_image": {"queue": "images"},
+    "myapp.tasks.clear_data": {"queue": "maintenance"},
+    "myapp.tasks.flush_pending_topics": {"queue": "maintenance"},
+}
+# 대기 중인 이미지 작업을 한 워커가 몰아 가져가지 않도록 한다.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 STORAGES = {
     "default": {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
@@ -223,8 +309,17 @@ AWS_QUERYSTRING_AUTH = (
 )
 
 CELERY_BEAT_SCHEDULE = {
-    "clear_data_every_day": {
+    "clear_data_every_hour": {
         "task": "myapp.tasks.clear_data",  # task의 경로를 정확하게 설정해야 합니다.
-        "schedule": crontab(minute="0", hour="4"),  # 매일 4시 0분에 실행합니다.
+        "schedule": crontab(minute="0"),  # 매 시 0분에 실행합니다.
+    },
+    "flush_pending_topics": {
+        "task": "myapp.tasks.flush_pending_topics",
+        "schedule": 30.0,  # 코디네이터가 멈춘 방에 남은 주제 변경을 30초마다 DB에 쓴다.
     },
 }
+
+# clear_data: 한 번에 지우는 방 수, 삭제 후 보관 시간(초), 닫히지 않은 방의 보관 시간(초)
+CLEAR_DATA_BATCH_SIZE = 500
+CLEAR_DATA_DELETED_AGE = 60 * 60
+CLEAR_DATA_STALE_AGE = 60 * 60 * 24
@@ -1,3 +1,31 @@
+import os
+import socket
+
 bind = "0.0.0.0:8000"
 workers = 4
 worker_class = "uvicorn.workers.UvicornWorker"
+
+# 방 단위 고정 라우팅 (ROOM_AFFINITY=true)
+# 8000번은 지금처럼 모든 워커가 같이 받고(API), 워커마다 자기 포트(8001~8004)를 하나씩 더 연다.
+# nginx는 웹소켓을 roomid 해시로 이 포트들 중 하나에 보내서 한 방의 소켓이 한 프로세스에 모이게 한다.
+# 워커가 죽어 다시 뜨면 같은 번호(포트)를 이어받는다.
+# (워커별 지표 포트는 8101~ 이므로 겹치지 않는다. settings.PROMETHEUS_METRICS_EXPORT_PORT_RANGE)
+if os.getenv("ROOM_AFFINITY", "false") == "true":
+    affinity_port = int(os.getenv("ROOM_AFFINITY_PORT", "8001"))
+
+    def pre_fork(server, worker):
+        used = {getattr(w, "affinity_slot", None) for w in server.WORKERS.values()}
+        worker.affinity_slot = min(set(range(server.num_workers)) - used)
+
+    def post_fork(server, worker):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("0.0.0.0", affinity_port + worker.affinity_slot))
+        sock.listen(server.cfg.backlog)
+        sock.setblocking(False)
+        worker.sockets = worker.sockets + [sock]
+        server.log.info(
+            "worker %s serves room affinity port %s",
+            worker.pid,
+            affinity_port + worker.affinity_slot,
+        )
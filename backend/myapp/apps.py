@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ChannelsConfig(AppConfig):
     name = "myapp"
     verbose_name = "channels"
+
+    def ready(self):
+        from . import metrics
+
+        metrics.install()
@@ -1,31 +1,67 @@
 import json
 import asyncio
-import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
-from .models import Room, SubRoom, Topic
-from .tasks import create_image, translate_text
+from django.conf import settings
+from . import image_ready, metrics, protocol
+from .coordinator import ensure_coordinator
+from .metrics import database_sync_to_async
+from .models import Room, SubRoom
+from .room_state import RoomState
+from .tasks import (
+    generate_round_images,
+    pipeline_task_ids,
+    revoke_image_pipeline,
+    start_image_pipeline,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class RoomConsumer(AsyncWebsocketConsumer):
+    # 클라이언트가 보내는 이벤트 (지표 라벨)
+    EVENTS = (
+        "nameChanged",
+        "startGame",
+        "inputTitle",
+        "changeTitle",
+        "ping",
+        "pong",
+        "getState",
+        "submitTopic",
+        "wantResult",
+    )
+
+    # 연결마다 필요한 상태는 여기서만 만든다.
+    # 방 단위 상태(라운드 등)는 소켓마다 복사하지 않고, 같은 프로세스의 같은 방 컨슈머들이
+    # RoomState.local 하나를 공유한다.
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.connection_open = False
-        self.room_id = None
-        self.room_group_name = None
+        self.state = None
         self.sub_room_id = None
         self.present_sub_room_id = None
-        self.last_activity_time = None
-        self.timeout = 60
-        self.ping_interval = 50
-        self.status_interval = 3
-        self.ping_task = None
-        self.status_task = None
-        self.round = 0
-        self.time = None
+        self.image_request = None
+        self.next_round_task = None
+        self.compact = False
+        self.outbox = None
+        self.flush_handle = None
+
+    @property
+    def room_id(self):
+        return self.state.room_id
+
+    @property
+    def room_group_name(self):
+        return self.state.group_name
+
+    @property
+    def round(self):
+        return self.state.current_round if self.state else 0
+
+    @round.setter
+    def round(self, round):
+        self.state.current_round = round
 
     async def send(self, text_data=None, bytes_data=None, close=False):
         if not self.connection_open:
@@ -37,17 +73,57 @@ class RoomConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Failed to send message: {e}")
 
+    # 이벤트 하나를 클라이언트 형식(JSON 텍스트 / msgpack)에 맞춰 보낸다.
+    # frames: protocol.group_event에서 미리 인코딩해 둔 프레임
+    async def send_event(self, message, frames=None):
+        if not self.compact:
+            await self.send(text_data=frames["text"] if frames else json.dumps(message))
+            return
+
+        # msgpack 클라이언트에는 연달아 보내는 이벤트를 한 프레임으로 묶어 보낸다.
+        if self.outbox is None:
+            self.outbox = []
+        self.outbox.append(frames["bytes"] if frames else protocol.encode(message)["bytes"])
+        if self.flush_handle is None:
+            # 기다리는 동안은 Task 대신 가벼운 타이머 핸들만 둔다.
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                settings.WS_COALESCE_WINDOW, self.flush_later
+            )
+
+    def flush_later(self):
+        self.flush_handle = None
+        asyncio.ensure_future(self.flush_outbox())
+
+    async def flush_outbox(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.outbox:
+            frames, self.outbox = self.outbox, None
+            await self.send(bytes_data=protocol.pack_frames(frames))
+
+    # 그룹 메시지를 그대로 클라이언트에 전달
+    async def forward(self, event):
+        await self.send_event(event["message"], event.get("frames"))
+
     async def connect(self, text_data=None):
         if text_data is not None:
             json.loads(text_data)
 
-        self.room_id = self.scope["url_route"]["kwargs"]["roomid"]
-        self.room_group_name = "main_room_%s" % self.room_id
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-        self.connection_open = True
-        self.last_activity_time = time.time()
-        self.ping_task = asyncio.create_task(self.send_ping())
+        # msgpack 서브프로토콜을 요청한 클라이언트와는 msgpack으로 주고받는다.
+        self.compact = protocol.MSGPACK in self.scope.get("subprotocols", [])
+
+        self.state = RoomState.local(self.scope["url_route"]["kwargs"]["roomid"])
+
+        # 입장 가능 여부는 캐시된 방 정보로만 판단한다. 거절된 소켓은 DB/채널 레이어를 건드리지 않는다.
+        rejection = await self.state.check_admission()
+        if rejection == RoomState.NOT_FOUND:
+            logger.error("No room with the specified ID found.")
+            await self.close(1008)
+            return
+        if rejection is not None:
+            await self.reject(rejection)
+            return
 
         room = await self.get_room_by_id(self.room_id)
         if room is None:
@@ -55,297 +131,269 @@ class RoomConsumer(AsyncWebsocketConsumer):
             await self.close(1008)
             return
 
-        sub_room_count = await self.get_subroom_count(room)
-        if sub_room_count >= 6:
-            error_message = "방이 가득 찼습니다."
-            await self.send(text_data=json.dumps({"error": error_message}))
-            await self.close(1008)
+        sub_room = await database_sync_to_async(SubRoom.add_subroom)(room)
+        if sub_room is None:
+            await self.reject(RoomState.FULL)
             return
 
-        sub_room = await sync_to_async(SubRoom.add_subroom)(room)
+        await self.accept_protocol()
+        self.connection_open = True
+
         self.sub_room_id = sub_room.id
+        await self.state.touch(sub_room.id)
+        await self.state.refresh_players()
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         self.present_sub_room_id = sub_room.id
 
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "event": "connected",
-                    "data": {
-                        "playerId": sub_room.id,
-                    },
-                }
-            )
+        await self.send_event(
+            {
+                "event": "connected",
+                "data": {
+                    "playerId": sub_room.id,
+                },
+            }
         )
 
         await self.send_player_list()
+        await ensure_coordinator(self.state)
+
+    async def accept_protocol(self):
+        await self.accept(protocol.MSGPACK if self.compact else None)
+        metrics.OPEN_SOCKETS.inc()
+
+    async def reject(self, error_message):
+        await self.accept_protocol()
+        self.connection_open = True
+        await self.send_event({"event": "error", "data": {"error": error_message}})
+        await self.flush_outbox()
+        await self.close(1008)
 
     async def disconnect(self, close_code):
-        if self.ping_task:
-            self.ping_task.cancel()
+        if self.next_round_task:
+            self.next_round_task.cancel()
+        if self.flush_handle:
+            self.flush_handle.cancel()
+
+        if self.connection_open:
+            metrics.OPEN_SOCKETS.dec()
+        self.connection_open = False
 
-        if self.status_task:
-            self.status_task.cancel()
+        # 입장이 거절된 소켓은 정리할 것이 없다.
+        if self.sub_room_id is None:
+            return
 
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-        self.connection_open = False
+        await self.state.forget_player(self.sub_room_id)
 
         sub_room = await self.get_subroom_by_id(self.sub_room_id)
         if sub_room:
-            await sync_to_async(sub_room.delete_subroom)()
-
-        room = await self.get_room_by_id(self.room_id)
-        remaining_subrooms_exists = await self.get_remaining_subrooms(room)
-        if not remaining_subrooms_exists and room is not None:
-            await sync_to_async(room.delete)()
+            await database_sync_to_async(sub_room.delete_subroom)()
+
+        players = await self.state.refresh_players()
+        if not players:
+            room = await self.get_room_by_id(self.room_id)
+            if room is not None:
+                await database_sync_to_async(room.delete)()
+            await self.state.clear()
+            return
 
         await self.send_player_list()
 
+        # 나간 플레이어만 제출하지 않은 상태였으면 기다리던 라운드를 끝낸다.
+        if self.round >= 1:
+            await self.finish_round_if_complete()
+
     async def receive(self, text_data=None, bytes_data=None, **kwargs):
         if not self.connection_open:
             logger.error("WebSocket connection is not open. Skipping send.")
             return
 
-        if text_data:
-            res = json.loads(text_data)
+        if text_data or bytes_data:
+            res = protocol.decode(text_data, bytes_data)
             event = res.get("event")
             data = res.get("data")
             logger.info(res)
 
-            if event == "nameChanged":
-                await self.handle_name_change(data)
-
-            elif event == "startGame":
-                self.present_sub_room_id = self.sub_room_id
+            # 이벤트 종류별 처리 시간/쿼리 수 등을 Prometheus로 내보낸다. (모르는 이벤트는 하나로 묶는다)
+            with metrics.observe_event(event if event in self.EVENTS else "unknown"):
+                await self.handle_event(event, data)
 
-                self.round = 1
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "start",
-                        "message": {"event": "gameStart", "round": self.round},
-                    },
-                )
-                self.status_task = asyncio.create_task(self.send_status())
+    async def handle_event(self, event, data):
+        if event == "nameChanged":
+            await self.handle_name_change(data)
 
-            elif event == "inputTitle":
-                title = data["title"]
-                player_id = data["playerId"]
+        elif event == "startGame":
+            self.round = 1
+            await self.state.reset_game()
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                protocol.group_event("start", {"event": "gameStart", "round": self.round}),
+            )
 
-                # 중복 inputTitle 확인
-                last_topic = await sync_to_async(Topic.get_last_topic)(self.present_sub_room_id)
-                if last_topic is not None and player_id == last_topic.player_id:
-                    return
+        elif event == "inputTitle":
+            title = data["title"]
+            player_id = data["playerId"]
 
-                room_num = await self.get_room_count()
+            # 중복 inputTitle 확인
+            last_topic = await self.state.get_topic(self.present_sub_room_id, self.round)
+            if last_topic is not None and player_id == last_topic["player_id"]:
+                return
 
-                await self.save_topic(title, self.present_sub_room_id, player_id)
+            await self.state.add_topic(self.present_sub_room_id, self.round, title, player_id)
 
-                room = await self.get_room_by_id(self.room_id)
+            # 다른 플레이어를 기다리는 동안 이미지를 미리 만들어 둔다.
+            if settings.IMAGE_PREFETCH:
+                await self.request_image(self.present_sub_room_id, self.round, title)
 
-                room.completeNum += 1
-                await sync_to_async(room.save)()
+            complete_num = await self.state.mark_complete(self.round, player_id)
 
-                await self.channel_layer.group_send(
-                    self.room_group_name,
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                protocol.group_event(
+                    "make_new_topic",
                     {
-                        "type": "make_new_topic",
-                        "message": {
-                            "event": "completeUpdate",
-                            "data": {"completeNum": room.completeNum},
-                        },
+                        "event": "completeUpdate",
+                        "data": {"completeNum": complete_num},
                     },
-                )
-
-                if room_num <= room.completeNum:
-                    room.completeNum = 0
-                    await sync_to_async(room.save)()
-
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            "type": "show_loading",
-                            "message": {"event": "loading_and_url", "data": "로딩이다."},
-                        },
-                    )
+                ),
+            )
 
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {"type": "ai_image_url", "message": "ai image url 생성"},
-                    )
+            await self.finish_round_if_complete()
 
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {"type": "next_round", "message": "다음 라운드 정보 주거나 게임 종료"},
-                    )
+        elif event == "changeTitle":
+            title = data["title"]
 
-            elif event == "changeTitle":
-                title = data["title"]
+            topic = await self.state.change_title(self.present_sub_room_id, self.round, title)
 
-                topic = await sync_to_async(Topic.get_last_topic)(self.present_sub_room_id)
+            # 바뀐 제목으로 다시 만든다. 이전 작업의 결과는 save_image_url에서 버려진다.
+            if topic is not None and settings.IMAGE_PREFETCH:
+                await self.request_image(self.present_sub_room_id, self.round, title)
 
-                topic.title = title
-                await sync_to_async(topic.save)()
+        elif event == "ping":
+            await self.state.touch(self.sub_room_id)
+            logger.info("ping received")
+            await self.send_event({"event": "pong", "data": "pong"})
+            await ensure_coordinator(self.state)
 
-            elif event == "ping":
-                self.last_activity_time = time.time()
-                logger.info("ping received")
-                await self.send(text_data=json.dumps({"event": "pong", "data": "pong"}))
+        elif event == "pong":
+            await self.state.touch(self.sub_room_id)
+            logger.info("pong received")
+            await ensure_coordinator(self.state)
 
-            elif event == "pong":
-                self.last_activity_time = time.time()
-                logger.info("pong received")
+        elif event == "getState":
+            # 재접속한 클라이언트가 현재 라운드 진행 상황을 받아간다.
+            completion = await self.state.get_completion()
+            await self.send_event({"event": "syncState", "data": completion})
 
-            elif event == "submitTopic":
-                await self.handle_topic_submission(data)
+        elif event == "submitTopic":
+            await self.handle_topic_submission(data)
 
-            elif event == "wantResult":
-                player_id = data["playerId"]
-                subroom = await self.get_subroom_by_id(player_id)
+        elif event == "wantResult":
+            player_id = data["playerId"]
 
-                # 게임 결과 데이터 생성
-                game_result = await self.generate_game_result(subroom)
+            # 게임 결과 데이터 (방 전체 결과를 한 번 만들어 캐시해 둔다)
+            results = await self.state.get_results()
+            game_result = results.get(player_id, [])
 
-                # 클라이언트에게 게임 결과 전송
+            # 같은 결과 요청이 연달아 들어오면 한 번만 전송
+            if await self.state.claim_result_broadcast(player_id):
                 await self.send_game_result(game_result)
 
-    @staticmethod
-    async def generate_game_result(subroom):
-        game_result = []
+    # 방에 남은 플레이어가 모두 제출했으면 라운드를 끝낸다. (한 컨슈머만 처리)
+    async def finish_round_if_complete(self):
+        if not await self.state.is_round_complete(self.round):
+            return
+        if not await self.state.claim_round(self.round):
+            return
 
-        topics = await sync_to_async(Topic.objects.filter)(sub_room=subroom, delete_at=None)
-        topics = await sync_to_async(list)(topics.order_by("created_at"))
+        # 라운드 동안 모인 주제를 DB에 쓴다.
+        await self.state.flush_topics()
 
-        try:
-            for topic in topics:
-                # topic 쓴 사람 찾음
-                player = await sync_to_async(SubRoom.objects.get)(id=topic.player_id)
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            protocol.group_event("show_loading", {"event": "loading_and_url", "data": "로딩이다."}),
+        )
 
-                game_result.append(
-                    {
-                        "title": topic.title,
-                        "player_name": player.first_player,
-                        "img": topic.url,
-                    }
-                )
+        await self.start_round_images()
 
-        except Exception as e:
-            # 예외 처리
-            print(f"Error: {e}")
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "next_round",
+                "message": "다음 라운드 정보 주거나 게임 종료",
+                "round": self.round + 1,
+            },
+        )
+
+    # 코디네이터가 응답 없는 플레이어를 내보냈을 때
+    async def players_evicted(self, event):
+        if self.sub_room_id in event["player_ids"]:
+            # 이 소켓이 내보내진 플레이어면 정리는 이미 끝났으므로 연결만 닫는다.
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+            self.sub_room_id = None
+            await self.flush_outbox()
+            await self.close(1008)
+            return
 
-        # 결과 반환
-        return game_result
+        # 나간 플레이어 때문에 멈춰 있던 라운드가 끝났을 수 있다.
+        if self.round >= 1:
+            await self.finish_round_if_complete()
 
     async def send_game_result(self, game_result):
         if game_result:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {"type": "game_result_message", "message": {"game_result": game_result}},
+                protocol.group_event(
+                    "game_result_message",
+                    {"event": "gameResult", "data": {"game_result": game_result}},
+                ),
             )
 
     async def game_result_message(self, event):
-        game_result = event["message"]
-        await self.send(text_data=json.dumps({"event": "gameResult", "data": game_result}))
+        await self.forward(event)
 
-    async def send_ping(self):
-        while True:
-            try:
-                await self.send(text_data=json.dumps({"event": "ping", "data": "ping"}))
-                await asyncio.sleep(self.ping_interval)
-                self.last_activity_time = time.time()
-                elapsed_time = time.time() - self.last_activity_time
-                if elapsed_time > self.timeout:
-                    await self.close()
-                    break
-            except asyncio.CancelledError:
-                await self.close()
-            except Exception as e:
-                logger.error(f"Unexpected error occurred: {e}")
-                await self.close()
-
-    async def send_status(self):
-        while self.round >= 1:
-            try:
-                print("send status")
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "game_progress",
-                        "message": {"event": "gameProgress", "data": self.round},
-                    },
-                )
-                await asyncio.sleep(self.status_interval)
-            except asyncio.CancelledError:
-                print("send status cancelled")
-                await self.close()
-            except Exception as e:
-                logger.error(f"Unexpected error occurred: {e}")
-                print("send status error")
-                await self.close()
+    async def heartbeat(self, event):
+        await self.forward(event)
 
     async def handle_topic_submission(self, data):
         pass
 
     async def renew_list(self, event):
-        message_content = event["message"]
-
-        await self.send(text_data=json.dumps(message_content))
+        await self.forward(event)
 
     async def make_new_topic(self, event):
-        message_content = event["message"]
-
-        await self.send(text_data=json.dumps(message_content))
+        await self.forward(event)
 
     async def start(self, event):
         message_content = event["message"]
         self.round = message_content["round"]
-        await self.send(text_data=json.dumps(message_content))
+        self.present_sub_room_id = self.sub_room_id
+        await self.forward(event)
 
     async def show_loading(self, event):
-        message_content = event["message"]
-
-        await self.send(text_data=json.dumps(message_content))
+        await self.forward(event)
 
     async def image_created_fail(self, event):
-        message_content = event["message"]
-
-        await self.send(text_data=json.dumps(message_content))
+        await self.forward(event)
 
-    async def ai_image_url(self, event):
+    async def start_round_images(self):
         try:
-            topic = await sync_to_async(Topic.get_last_topic)(self.present_sub_room_id)
-
-            translated_result = await sync_to_async(translate_text.delay)(topic.title)
-
-            translated_text = await sync_to_async(translated_result.get)()
-            result = await sync_to_async(create_image.delay)(translated_text)
-
-            await self.send(
-                text_data=json.dumps({"message": "Image creation started", "task_id": result.id})
+            # 방의 이미지는 워커에서 한 번에 만든다. (이 소켓이 끊겨도 계속 진행된다)
+            # 결과는 기다리지 않는다. 완료되면 image_ready 이벤트로 전달된다.
+            result = await database_sync_to_async(generate_round_images.delay)(
+                self.state.room_id, self.round
             )
 
-            image_url = await sync_to_async(result.get)()
-
-            if "error" in image_url:
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "image_created_fail",
-                        "message": {
-                            "event": "image_creation_failed",
-                            "data": {"error": "AI가 만들 수 없는 주제 입니다."},
-                        },
-                    },
-                )
-                return
-
-            await self.send(
-                text_data=json.dumps(
-                    {"message": "Image creation completed", "image_url": image_url}
-                )
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    "type": "ai_image_url",
+                    "message": "ai image url 생성",
+                    "task_id": result.id,
+                    "round": self.round,
+                },
             )
-            topic.url = image_url
-            await sync_to_async(topic.save)()
 
         except Exception as e:
             # Log the error along with its traceback
@@ -355,99 +403,131 @@ class RoomConsumer(AsyncWebsocketConsumer):
             print(error_message)
 
             try:
-                # If there's an unexpected error while getting the task result
+                # If there's an unexpected error while starting the task
 
                 await self.channel_layer.group_send(
                     self.room_group_name,
-                    {
-                        "type": "image_created_fail",
-                        "message": {
+                    protocol.group_event(
+                        "image_created_fail",
+                        {
                             "event": "image_creation_failed",
                             "data": {"error": error_message},
                         },
-                    },
+                    ),
                 )
 
             except Exception as group_send_error:
                 print(f"An error occurred while sending the group message: {group_send_error}")
 
-    async def next_round(self, event):
-        room_num = await self.get_room_count()
+    async def ai_image_url(self, event):
+        # 라운드는 같은 방 컨슈머들이 공유하므로 (다른 컨슈머가 먼저 다음 라운드로 넘겼을 수 있다) 이벤트의 값을 쓴다.
+        self.image_request = (self.present_sub_room_id, event["round"])
+        await self.send_event({"message": "Image creation started", "task_id": event["task_id"]})
 
-        room = await self.get_room_by_id(self.room_id)
+        # 미리 시작한 작업이 이미 끝났으면 바로 알린다.
+        image_url = await self.state.get_url(*self.image_request)
+        if image_url is not None:
+            await self.send_image_completed(image_url)
+
+    async def image_ready(self, event):
+        message_content = event["message"]
+        image_ready.notify(
+            self.state.room_id,
+            message_content["sub_room_id"],
+            message_content["round"],
+            message_content["url"],
+        )
+
+        if (message_content["sub_room_id"], message_content["round"]) != self.image_request:
+            return
+
+        await self.send_image_completed(message_content["url"])
+
+    async def send_image_completed(self, image_url):
+        self.image_request = None
+        await self.send_event({"message": "Image creation completed", "image_url": image_url})
+
+    async def request_image(self, sub_room_id, round, title):
+        # 같은 제목으로 이미 시작한 작업이 있으면 다시 만들지 않는다.
+        job = await self.state.get_image_job(sub_room_id, round)
+        if job is not None and job["title"] == title:
+            return job["task_id"]
+
+        # 예전 제목으로 시작한 작업은 아직 시작하지 않은 단계를 취소해서 쓸모없는 이미지 생성을 막는다.
+        if job is not None:
+            await database_sync_to_async(revoke_image_pipeline)(job)
+        result = await database_sync_to_async(start_image_pipeline)(
+            self.state.room_id, sub_room_id, round, title
+        )
+        await self.state.set_image_job(
+            sub_room_id, round, title, result.id, pipeline_task_ids(result)
+        )
+        return result.id
 
-        self.round += 1
+    async def next_round(self, event):
+        room_num = await self.state.get_player_count()
+
+        # 같은 프로세스의 컨슈머들이 라운드를 공유하므로 증가시키지 않고 이벤트의 값으로 맞춘다.
+        self.round = event["round"]
 
         if room_num < self.round:
-            await self.send(text_data=json.dumps({"event": "end", "data": "게임이 종료 됐습니다."}))
+            await self.state.set_round(0)
+            await self.send_event({"event": "end", "data": "게임이 종료 됐습니다."})
             return
-        present_sub_room = await sync_to_async(SubRoom.objects.get)(id=self.present_sub_room_id)
-        self.present_sub_room_id = await sync_to_async(present_sub_room.get_next_id)()
+        self.present_sub_room_id = await self.state.get_next_player_id(self.present_sub_room_id)
+        await self.state.set_round(self.round)
+
+        # 이미지 완료 알림(image_ready)을 받을 수 있도록 기다리는 작업은 따로 실행한다.
+        self.next_round_task = asyncio.create_task(
+            self.move_next_round(self.present_sub_room_id, self.round)
+        )
 
+    async def move_next_round(self, sub_room_id, round):
         # 다음 이미지 전달
-        while True:
-            topic = await sync_to_async(Topic.get_last_topic)(self.present_sub_room_id)
-            image_url = topic.url
-            if image_url is not None:
-                break
-
-        await self.send(
-            text_data=json.dumps(
+        image_url = await image_ready.wait_for_url(self.state, sub_room_id, round - 1)
+        if image_url is None:
+            await self.send_event(
                 {
-                    "event": "moveNextRound",
-                    "data": {"round": self.round, "complete": room.completeNum, "url": image_url},
+                    "event": "image_creation_failed",
+                    "data": {"error": "이미지를 불러오지 못했습니다."},
                 }
             )
+            return
+
+        complete_num = await self.state.get_complete_num(round)
+        await self.send_event(
+            {
+                "event": "moveNextRound",
+                "data": {"round": round, "complete": complete_num, "url": image_url},
+            }
         )
 
-    @sync_to_async
+    @database_sync_to_async
     def get_room_by_id(self, room_id):
         try:
             return Room.objects.get(id=room_id)
         except Room.DoesNotExist:
             return None
 
-    @sync_to_async
+    @database_sync_to_async
     def get_subroom_by_id(self, subroom_id):
         try:
             return SubRoom.objects.get(id=subroom_id)
         except SubRoom.DoesNotExist:
             return None
 
-    @sync_to_async
-    def get_room_count(self):
-        room = Room.objects.get(id=self.room_id)
-        room_count = SubRoom.objects.filter(room=room, delete_at=None).count()
-
-        return room_count
-
-    @sync_to_async
-    def get_subroom_count(self, room):
-        return SubRoom.objects.filter(room=room, delete_at=None).count()
-
-    @sync_to_async
-    def get_remaining_subrooms(self, room):
-        return SubRoom.objects.filter(room=room, delete_at=None).exists()
-
-    @sync_to_async
-    def save_topic(self, title, present_sub_room_id, player_id):
-        sub_room = SubRoom.objects.get(id=present_sub_room_id)
-        topic = Topic.objects.create(title=title, url=None, player_id=player_id, sub_room=sub_room)
-        return topic
-
     async def game_progress(self, event):
         error_message = "게임이 이미 시작되어 참가할 수 없습니다."
         print("group send")
         if self.round == 0:
             print("에러")
-            await self.send(
-                text_data=json.dumps(
-                    {
-                        "event": "error",
-                        "data": {"error": error_message},
-                    }
-                )
+            await self.send_event(
+                {
+                    "event": "error",
+                    "data": {"error": error_message},
+                }
             )
+            await self.flush_outbox()
             await self.close(1008)
             return
 
@@ -456,45 +536,27 @@ class RoomConsumer(AsyncWebsocketConsumer):
         new_name = data.get("name")
 
         # 현재 룸 있는 플레이어 수
-        room = await self.get_room_by_id(self.room_id)
-        subroom_count = await self.get_subroom_count(room)
+        subroom_count = await self.state.get_player_count()
 
-        sub_room = await self.get_subroom_by_id(player_id)
-
-        if sub_room:
-            sub_room.first_player = new_name
-            await sync_to_async(sub_room.save)()
-
-            await self.send(text_data=json.dumps({"event": "changeName", "data": "이름 변경 성공"}))
+        if await self.state.rename_player(player_id, new_name):
+            await self.send_event({"event": "changeName", "data": "이름 변경 성공"})
 
         # room에 플레이어가 혼자가 아닐 경우 모두에게 바뀐 플레이어 이름 정보 그룹send로 보내준다.
         if subroom_count > 1:
             await self.send_player_list()
 
     async def send_player_list(self):
-        room = await self.get_room_by_id(self.room_id)
-        sub_rooms = await sync_to_async(SubRoom.objects.filter)(room=room, delete_at=None)
-
-        players_data = await sync_to_async(
-            lambda: [
-                {
-                    "player_id": subroom.id,
-                    "name": subroom.first_player,
-                    "isHost": subroom.is_host,
-                }
-                for subroom in sub_rooms
-            ]
-        )()
+        players_data = await self.state.get_players()
 
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "renew_list",
-                "message": {
+            protocol.group_event(
+                "renew_list",
+                {
                     "event": "renewList",
                     "data": {
                         "players": players_data,
                     },
                 },
-            },
+            ),
         )
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import uuid
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from . import protocol
+from .metrics import database_sync_to_async
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+# 이 프로세스에서 실행 중인 방 코디네이터 (room_id -> asyncio.Task)
+_running = {}
+
+
+# 방마다 하나의 코디네이터만 heartbeat(ping)와 진행 상황(gameProgress)을 보낸다.
+# 캐시 락(SET NX + TTL)으로 선출하며, 락을 가진 프로세스가 죽으면 TTL 후 다른 컨슈머가 이어받는다.
+class RoomCoordinator:
+    def __init__(self, state):
+        self.state = state
+        self.token = uuid.uuid4().hex
+        self.lock_key = state.key("coordinator")
+        self.status_interval = settings.ROOM_STATUS_INTERVAL
+        self.ping_interval = settings.ROOM_PING_INTERVAL
+        self.presence_timeout = settings.PRESENCE_TIMEOUT
+        self.flush_interval = settings.TOPIC_FLUSH_INTERVAL
+        self.lease = self.status_interval * 3
+        self.last_ping = 0
+        self.last_flush = 0
+
+    async def acquire(self):
+        if not await cache.aadd(self.lock_key, self.token, self.lease):
+            return False
+        # 코디네이터가 없던 동안에는 pong을 받지 못했으므로 모든 플레이어를 지금부터 다시 잰다.
+        await self.state.reset_presence()
+        return True
+
+    # 락 값(소유자)은 바꾸지 않고 만료 시간만 늘린다. (TOUCH/EXPIRE 한 번)
+    # 확인과 쓰기 사이에 다른 프로세스가 락을 새로 잡아도 그 소유자를 덮어쓰지 않으며,
+    # 그 경우 아래 확인에서 락을 잃은 것으로 보고 멈춘다.
+    async def renew(self):
+        if not await cache.atouch(self.lock_key, self.lease):
+            return False
+        return await cache.aget(self.lock_key) == self.token
+
+    async def release(self):
+        if await cache.aget(self.lock_key) == self.token:
+            await cache.adelete(self.lock_key)
+
+    async def run(self):
+        channel_layer = get_channel_layer()
+        self.last_ping = 0
+        self.last_flush = asyncio.get_running_loop().time()
+        try:
+            while True:
+                # 캐시/DB의 일시적인 오류로 방의 heartbeat와 flush가 멈추지 않도록
+                # 한 번의 실패는 기록만 하고 다음 주기에 다시 한다. 락을 잃었을 때만 멈춘다.
+                try:
+                    if not await self.renew():
+                        break
+                    if not await self.tick(channel_layer):
+                        break
+                except Exception as e:
+                    logger.error(f"Room coordinator tick failed: {e}")
+                await asyncio.sleep(self.status_interval)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # 코디네이터가 멈추거나 프로세스가 종료될 때 남은 변경을 쓴다.
+            try:
+                await self.state.flush_topics()
+            except Exception as e:
+                logger.error(f"Failed to flush topics: {e}")
+            await self.release()
+            _running.pop(self.state.room_id, None)
+
+    # 한 주기: 접속 확인, ping, 주제 flush, 진행 상황. 방에 플레이어가 없으면 False.
+    async def tick(self, channel_layer):
+        players = await self.state.get_players()
+        if players:
+            players = await self.sweep(channel_layer, players)
+        if not players:
+            return False
+
+        now = asyncio.get_running_loop().time()
+        if now - self.last_ping >= self.ping_interval:
+            self.last_ping = now
+            await channel_layer.group_send(
+                self.state.group_name,
+                protocol.group_event("heartbeat", {"event": "ping", "data": "ping"}),
+            )
+
+        # 모아 둔 주제 변경을 DB에 쓴다. (write-behind)
+        if now - self.last_flush >= self.flush_interval:
+            self.last_flush = now
+            await self.state.flush_topics()
+
+        round = await self.state.get_round()
+        if round >= 1:
+            await channel_layer.group_send(
+                self.state.group_name,
+                {
+                    "type": "game_progress",
+                    "message": {"event": "gameProgress", "data": round},
+                },
+            )
+        return True
+
+    # ping/pong이 presence_timeout 동안 없는 플레이어를 한 번에 내보내고 링을 복구한다.
+    # 남은 플레이어 목록을 반환한다.
+    async def sweep(self, channel_layer, players):
+        stale = await self.state.get_stale_players(self.presence_timeout)
+        if not stale:
+            return players
+
+        logger.info(f"Evicting stale players {stale} from room {self.state.room_id}")
+        remaining = await self.state.evict_players(stale)
+        if not remaining:
+            room = await database_sync_to_async(Room.objects.filter(id=self.state.room_id).first)()
+            if room is not None:
+                await database_sync_to_async(room.delete)()
+            await self.state.clear()
+            return []
+
+        # 아직 연결된(반쯤 끊긴) 소켓은 스스로 닫고, 남은 플레이어들은 목록을 갱신하고
+        # 나간 플레이어 때문에 멈춰 있던 라운드를 다시 확인한다.
+        players = await self.state.get_players()
+        await channel_layer.group_send(
+            self.state.group_name,
+            protocol.group_event(
+                "renew_list", {"event": "renewList", "data": {"players": players}}
+            ),
+        )
+        await channel_layer.group_send(
+            self.state.group_name, {"type": "players_evicted", "player_ids": stale}
+        )
+        return players
+
+
+async def ensure_coordinator(state):
+    task = _running.get(state.room_id)
+    if task is not None and not task.done():
+        return task
+
+    coordinator = RoomCoordinator(state)
+    if not await coordinator.acquire():
+        return None
+
+    task = asyncio.create_task(coordinator.run())
+    _running[state.room_id] = task
+    return task
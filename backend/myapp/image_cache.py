@@ -0,0 +1,45 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+
+# 번역된 프롬프트 + 이미지 크기로 이미 S3에 올라간 이미지를 찾는다.
+# 적중하면 OpenAI 생성과 S3 업로드를 건너뛴다. 적중할 때마다 만료 시간을 연장하므로
+# 오래 쓰이지 않은 이미지부터 빠진다(LRU).
+def normalize(prompt):
+    return " ".join(prompt.lower().split())
+
+
+def cache_key(prompt, size):
+    digest = hashlib.sha256(f"{size}:{normalize(prompt)}".encode()).hexdigest()
+    return f"image_cache:{digest}"
+
+
+def get(prompt, size):
+    key = cache_key(prompt, size)
+    s3_key = cache.get(key)
+    if s3_key is None:
+        record("misses")
+        return None
+
+    cache.touch(key, settings.IMAGE_CACHE_TIMEOUT)
+    record("hits")
+    return s3_key
+
+
+def put(prompt, size, s3_key):
+    cache.set(cache_key(prompt, size), s3_key, settings.IMAGE_CACHE_TIMEOUT)
+
+
+def record(name):
+    key = f"image_cache:{name}"
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+
+def stats():
+    counts = cache.get_many(["image_cache:hits", "image_cache:misses"])
+    return {
+        "hits": counts.get("image_cache:hits", 0),
+        "misses": counts.get("image_cache:misses", 0),
+    }
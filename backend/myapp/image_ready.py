@@ -0,0 +1,35 @@
+import asyncio
+from django.conf import settings
+
+# (방, SubRoom, 라운드) 별 "이미지 완료" 알림.
+# 같은 프로세스의 컨슈머들이 공유하며, image_ready 그룹 메시지를 받은 컨슈머가 notify 한다.
+_waiters = {}
+
+
+def notify(room_id, sub_room_id, round, url):
+    waiter = _waiters.get((room_id, sub_room_id, round))
+    if waiter is not None:
+        waiter["url"] = url
+        waiter["event"].set()
+
+
+async def wait_for_url(state, sub_room_id, round, timeout=None):
+    if timeout is None:
+        timeout = settings.IMAGE_READY_TIMEOUT
+
+    key = (state.room_id, sub_room_id, round)
+    waiter = _waiters.setdefault(key, {"event": asyncio.Event(), "url": None})
+    try:
+        # 기다리기 전에 이미 완료됐을 수 있으므로 등록 후 한 번 확인한다.
+        url = await state.get_url(sub_room_id, round)
+        if url is not None:
+            return url
+
+        try:
+            await asyncio.wait_for(waiter["event"].wait(), timeout)
+            return waiter["url"]
+        except asyncio.TimeoutError:
+            # 알림을 놓쳤거나 다른 노드에서 저장된 경우 DB를 한 번 확인한다.
+            return await state.load_url(sub_room_id, round)
+    finally:
+        _waiters.pop(key, None)
@@ -0,0 +1,127 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from channels.db import DatabaseSyncToAsync
+from channels.layers import get_channel_layer
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import Gauge, Histogram
+
+# 웹소켓 이벤트(RoomConsumer.receive) 처리 지표. django_prometheus가 워커 프로세스마다 여는 포트(8101~)로 함께 나간다.
+# 이벤트 종류별로 처리 시간, ORM 쿼리 수, sync_to_async 대기 시간, 채널 레이어 group_send 시간을 잰다.
+EVENT_DURATION = Histogram("ws_event_duration_seconds", "웹소켓 이벤트 처리 시간", ["event"])
+EVENT_QUERIES = Histogram(
+    "ws_event_queries",
+    "웹소켓 이벤트 하나가 실행한 ORM 쿼리 수",
+    ["event"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+EVENT_SYNC_WAIT = Histogram(
+    "ws_event_sync_to_async_wait_seconds",
+    "sync_to_async 작업이 스레드를 기다린 시간 (이벤트 하나 합계)",
+    ["event"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+EVENT_CHANNEL_SEND = Histogram(
+    "ws_event_channel_send_seconds",
+    "채널 레이어 group_send 시간 (이벤트 하나 합계)",
+    ["event"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+OPEN_SOCKETS = Gauge("ws_open_sockets", "이 프로세스에 연결된 웹소켓 수")
+ACTIVE_ROOMS = Gauge("ws_active_rooms", "이 프로세스에 소켓이 있는 방 수")
+# create_image에서 inc/dec 한다. (Celery 워커 프로세스마다 따로 내보내고 Prometheus에서 합산한다)
+IMAGE_JOBS_IN_FLIGHT = Gauge("image_jobs_in_flight", "이 프로세스에서 이미지를 만드는 중인 작업 수")
+
+
+class EventStats:
+    __slots__ = ("queries", "sync_wait", "channel_send")
+
+    def __init__(self):
+        self.queries = 0
+        self.sync_wait = 0.0
+        self.channel_send = 0.0
+
+
+# 처리 중인 이벤트의 집계 (sync_to_async 스레드까지 컨텍스트로 이어진다)
+current_event = ContextVar("current_event", default=None)
+
+
+@contextmanager
+def observe_event(event):
+    stats = EventStats()
+    token = current_event.set(stats)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        current_event.reset(token)
+        EVENT_DURATION.labels(event).observe(time.perf_counter() - start)
+        EVENT_QUERIES.labels(event).observe(stats.queries)
+        EVENT_SYNC_WAIT.labels(event).observe(stats.sync_wait)
+        EVENT_CHANNEL_SEND.labels(event).observe(stats.channel_send)
+
+
+def count_query(execute, sql, params, many, context):
+    stats = current_event.get()
+    if stats is not None:
+        stats.queries += 1
+    return execute(sql, params, many, context)
+
+
+def add_query_counter(sender, connection, **kwargs):
+    # 같은 연결 객체가 다시 접속할 때도 신호가 오므로 한 번만 건다.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+# 컨슈머의 DB 작업은 sync_to_async(thread_sensitive)로 프로세스에 하나뿐인 스레드에서 차례로 실행된다.
+# channels의 database_sync_to_async와 같게 실행하면서, 작업이 그 스레드를 기다린 시간(큐 대기)을 현재 이벤트에 더한다.
+def database_sync_to_async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        stats = current_event.get()
+        queued = time.perf_counter()
+
+        def run():
+            if stats is not None:
+                stats.sync_wait += time.perf_counter() - queued
+            return func(*args, **kwargs)
+
+        return await DatabaseSyncToAsync(run)()
+
+    return wrapper
+
+
+def time_group_send(channel_layer):
+    group_send = channel_layer.group_send
+
+    async def timed_group_send(group, message):
+        stats = current_event.get()
+        if stats is None:
+            return await group_send(group, message)
+
+        start = time.perf_counter()
+        try:
+            return await group_send(group, message)
+        finally:
+            stats.channel_send += time.perf_counter() - start
+
+    channel_layer.group_send = timed_group_send
+
+
+# 앱 초기화(ChannelsConfig.ready) 때 한 번 실행한다.
+def install():
+    from .room_state import RoomState
+
+    ACTIVE_ROOMS.set_function(lambda: len(RoomState._local))
+
+    connection_created.connect(add_query_counter, dispatch_uid="myapp.metrics.count_query")
+    for connection in connections.all(initialized_only=True):
+        add_query_counter(None, connection)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        time_group_send(channel_layer)
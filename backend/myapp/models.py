@@ -1,14 +1,22 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
 # Room 모델
 class Room(models.Model):
+    MAX_PLAYERS = 6
+
     completeNum = models.IntegerField(default=0)
+    image_cache = models.BooleanField(default=True)  # 같은 주제의 이미지 재사용 여부
     created_at = models.DateTimeField(auto_now_add=True)  # 생성 시간
     delete_at = models.DateTimeField(null=True, blank=True)  # 삭제 시간
     update_at = models.DateTimeField(auto_now=True)  # 최종 업데이트 시간
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["delete_at"], name="room_delete_at_idx"),
+        ]
+
     # Room에서 delete 메서드를 호출할 때
     # Room 객체의 delete_at 필드를 현재 시간으로 설정하고 객체를 저장
     def delete(self, *args, **kwargs):
@@ -30,6 +38,12 @@ class SubRoom(models.Model):
     # Room 속한 Room
     next_room = models.ForeignKey("self", null=True, on_delete=models.SET_NULL)  # 다음 SubRoom
 
+    class Meta:
+        indexes = [
+            # 방의 살아있는 플레이어를 입장 순서로 조회 (filter room, delete_at=None / order_by created_at)
+            models.Index(fields=["room", "delete_at", "created_at"], name="subroom_room_alive_idx"),
+        ]
+
     # SubRoom 객체가 delete 메서드를 호출할 때 호출되는 함수
     # 이 함수는 SubRoom 객체의 delete_at 필드를 현재 시간으로 설정하고 객체를 저장
     def delete(self, *args, **kwargs):
@@ -37,8 +51,7 @@ class SubRoom(models.Model):
         self.save()
 
     def get_next_id(self):
-        next_sub_room_id = self.next_room.id
-        return next_sub_room_id
+        return self.next_room_id
 
     @classmethod
     def get_first_subroom(cls, room):
@@ -48,44 +61,99 @@ class SubRoom(models.Model):
     def get_last_subroom(cls, room):
         return cls.objects.filter(room=room, delete_at=None).order_by("-created_at").first()
 
+    # 플레이어 입장: 방 row를 잠그고 링(next_room)의 마지막 뒤에 새 SubRoom을 끼워 넣는다.
+    # 방 인원과 상관없이 쿼리 수가 일정하며, 방이 가득 찼으면 None을 반환한다.
     @classmethod
     def add_subroom(cls, room):
-        first_subroom = cls.get_first_subroom(room)
-        last_subroom = cls.get_last_subroom(room)
-
-        if last_subroom:
-            max_number = cls.objects.filter(room=room, delete_at=None).count() + 1
-        else:
-            max_number = 1
-
-        first_player = f"플레이어 {max_number}"
-
-        subroom = SubRoom.objects.create(first_player=first_player, room=room)
-
-        if last_subroom:
-            last_subroom.next_room = subroom
-            last_subroom.save()
-            subroom.next_room = first_subroom
-            subroom.save()
-        else:
-            subroom.next_room = subroom
-            subroom.save()
-
-        if (
-            max_number == 1
-            or not cls.objects.filter(room=room, is_host=True, delete_at=None).exists()
-        ):
-            subroom.is_host = True
-            subroom.save()
+        with transaction.atomic():
+            list(Room.objects.select_for_update().filter(id=room.id))
+
+            sub_rooms = list(
+                cls.objects.filter(room=room, delete_at=None)
+                .order_by("created_at")
+                .values("id", "is_host")
+            )
+            if len(sub_rooms) >= Room.MAX_PLAYERS:
+                return None
+
+            subroom = cls.objects.create(
+                first_player=f"플레이어 {len(sub_rooms) + 1}",
+                room=room,
+                is_host=not any(sub_room["is_host"] for sub_room in sub_rooms),
+                next_room_id=sub_rooms[0]["id"] if sub_rooms else None,
+            )
+
+            if sub_rooms:
+                # 마지막 플레이어 -> 새 플레이어 -> 첫 플레이어
+                cls.objects.filter(id=sub_rooms[-1]["id"]).update(
+                    next_room=subroom, update_at=timezone.now()
+                )
+            else:
+                subroom.next_room = subroom
+                cls.objects.filter(id=subroom.id).update(next_room=subroom)
 
         return subroom
 
+    # 플레이어 퇴장: 이전 플레이어가 다음 플레이어를 가리키도록 링을 복구하고,
+    # 방장이 나가면 가장 먼저 들어온 플레이어 한 명만 방장이 된다.
     def delete_subroom(self):
-        if self.is_host:
-            SubRoom.objects.filter(room=self.room, is_host=False, delete_at=None).order_by(
-                "created_at"
-            ).update(is_host=True, update_at=timezone.now())
-        self.delete()
+        with transaction.atomic():
+            list(Room.objects.select_for_update().filter(id=self.room_id))
+            now = timezone.now()
+
+            sub_rooms = list(
+                SubRoom.objects.filter(room_id=self.room_id, delete_at=None)
+                .order_by("created_at")
+                .values("id", "is_host", "next_room_id")
+            )
+            me = next((sub_room for sub_room in sub_rooms if sub_room["id"] == self.id), None)
+            others = [sub_room for sub_room in sub_rooms if sub_room["id"] != self.id]
+
+            if me is not None and others:
+                previous = next(
+                    (sub_room for sub_room in others if sub_room["next_room_id"] == self.id), None
+                )
+                if previous is not None:
+                    SubRoom.objects.filter(id=previous["id"]).update(
+                        next_room_id=me["next_room_id"], update_at=now
+                    )
+
+            self.delete()
+
+            if me is not None and me["is_host"] and others:
+                SubRoom.objects.filter(id=others[0]["id"]).update(is_host=True, update_at=now)
+
+    # 응답이 없는 플레이어 여러 명을 한 번에 내보낸다. (presence sweep)
+    # 남은 플레이어들을 입장 순서대로 다시 이어 링을 복구하고, 방장이 없으면 첫 플레이어가 방장이 된다.
+    # 남은 플레이어 id 목록을 반환한다.
+    @classmethod
+    def evict(cls, room_id, sub_room_ids):
+        with transaction.atomic():
+            list(Room.objects.select_for_update().filter(id=room_id))
+            now = timezone.now()
+
+            sub_rooms = list(
+                cls.objects.filter(room_id=room_id, delete_at=None)
+                .order_by("created_at")
+                .values("id", "is_host", "next_room_id")
+            )
+            survivors = [sub_room for sub_room in sub_rooms if sub_room["id"] not in sub_room_ids]
+
+            cls.objects.filter(room_id=room_id, id__in=sub_room_ids, delete_at=None).update(
+                delete_at=now, update_at=now
+            )
+
+            for index, sub_room in enumerate(survivors):
+                next_id = survivors[(index + 1) % len(survivors)]["id"]
+                if sub_room["next_room_id"] != next_id:
+                    cls.objects.filter(id=sub_room["id"]).update(
+                        next_room_id=next_id, update_at=now
+                    )
+
+            if survivors and not any(sub_room["is_host"] for sub_room in survivors):
+                cls.objects.filter(id=survivors[0]["id"]).update(is_host=True, update_at=now)
+
+        return [sub_room["id"] for sub_room in survivors]
 
     def hard_delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
@@ -99,6 +167,19 @@ class Topic(models.Model):
     delete_at = models.DateTimeField(null=True, blank=True)
     update_at = models.DateTimeField(auto_now=True)
     sub_room = models.ForeignKey("SubRoom", on_delete=models.CASCADE)
+    round = models.IntegerField(null=True, blank=True)  # 작성한 라운드 (릴레이 순서)
+
+    class Meta:
+        indexes = [
+            # SubRoom의 주제를 작성 순서로 조회 (filter sub_room, delete_at=None / order_by created_at)
+            models.Index(
+                fields=["sub_room", "delete_at", "created_at"], name="topic_subroom_alive_idx"
+            ),
+        ]
+        constraints = [
+            # 주제는 (SubRoom, 라운드)마다 하나. flush가 겹치거나 다시 실행돼도 중복 INSERT 되지 않는다.
+            models.UniqueConstraint(fields=["sub_room", "round"], name="topic_subroom_round_uniq"),
+        ]
 
     def delete(self, *args, **kwargs):
         self.delete_at = timezone.now()
@@ -0,0 +1,28 @@
+import json
+import msgpack
+
+# 웹소켓 메시지 형식
+# - 기본: 메시지 하나당 JSON 텍스트 프레임 하나
+# - "relaysketch.msgpack" 서브프로토콜로 접속한 클라이언트: msgpack 바이너리 프레임.
+#   짧은 시간(WS_COALESCE_WINDOW) 안에 보내는 메시지들은 배열 하나로 묶어 한 프레임으로 보낸다.
+MSGPACK = "relaysketch.msgpack"
+
+
+def encode(message):
+    return {"text": json.dumps(message), "bytes": msgpack.packb(message)}
+
+
+# 그룹 메시지는 보낼 때 한 번만 인코딩해 두고, 받는 컨슈머는 인코딩 없이 그대로 내보낸다.
+def group_event(type, message, **extra):
+    return {"type": type, "message": message, "frames": encode(message), **extra}
+
+
+# 각각 msgpack으로 인코딩된 메시지들을 다시 인코딩하지 않고 배열 하나로 묶는다.
+def pack_frames(frames):
+    return msgpack.Packer().pack_array_header(len(frames)) + b"".join(frames)
+
+
+def decode(text_data=None, bytes_data=None):
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data)
+    return json.loads(text_data)
@@ -0,0 +1,51 @@
+import time
+from django.core.cache import cache
+
+
+# 캐시(Redis)의 INCR로 세기 때문에 모든 워커가 같은 한도를 나눠 쓴다.
+# period초 구간마다 limit번까지 허용한다.
+class RateLimiter:
+    def __init__(self, name, limit, period):
+        self.name = name
+        self.limit = limit
+        self.period = period
+
+    # 허용되면 0, 아니면 다음 구간까지 기다려야 하는 시간(초)
+    def acquire(self):
+        now = time.time()
+        window = int(now // self.period)
+        key = "rate:%s:%d" % (self.name, window)
+
+        cache.add(key, 0, self.period * 2)
+        if cache.incr(key) <= self.limit:
+            return 0
+        return (window + 1) * self.period - now
+
+
+# 동시에 진행 중인 작업 수 제한
+# 워커가 죽어 release 되지 않은 몫은 마지막 acquire로부터 timeout이 지나면 사라진다.
+class InFlightLimit:
+    def __init__(self, name, limit, timeout):
+        self.key = "in_flight:%s" % name
+        self.limit = limit
+        self.timeout = timeout
+
+    def acquire(self):
+        cache.add(self.key, 0, self.timeout)
+        count = cache.incr(self.key)
+        # 만료 시간을 매번 늘려서 진행 중인 작업이 있는 동안 키가 사라지지 않게 한다.
+        cache.touch(self.key, self.timeout)
+        if count <= self.limit:
+            return True
+        self.release()
+        return False
+
+    def release(self):
+        try:
+            count = cache.decr(self.key)
+        except ValueError:
+            # 이미 만료된 경우
+            return
+        if count < 0:
+            # 만료 뒤 새로 생긴 키를 줄인 경우 음수로 남지 않게 지운다.
+            cache.delete(self.key)
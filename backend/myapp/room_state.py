@@ -0,0 +1,446 @@
+import time
+import weakref
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from .metrics import database_sync_to_async
+from .models import Room, SubRoom, Topic
+
+
+# 방 하나의 게임 상태(플레이어, 순서, completeNum, 라운드, 주제)를 캐시에 보관한다.
+# 이벤트마다 Room/SubRoom/Topic을 다시 조회하지 않고 여기서 읽고,
+# DB에는 영속화가 필요한 쓰기만 보낸다.
+class RoomState:
+    __slots__ = ("room_id", "group_name", "timeout", "current_round", "__weakref__")
+
+    MAX_PLAYERS = Room.MAX_PLAYERS
+    NOT_FOUND = "존재하지 않는 방입니다."
+    FULL = "방이 가득 찼습니다."
+    STARTED = "게임이 이미 시작되어 참가할 수 없습니다."
+
+    # 이 프로세스의 방별 인스턴스 (같은 방 컨슈머들이 하나를 같이 쓰고, 모두 끊기면 사라진다)
+    _local = weakref.WeakValueDictionary()
+
+    def __init__(self, room_id):
+        self.room_id = int(room_id)
+        self.group_name = "main_room_%s" % self.room_id
+        self.timeout = settings.ROOM_STATE_TIMEOUT
+        # 이 프로세스의 컨슈머들이 공유하는 현재 라운드 (start / next_round 이벤트로 갱신)
+        self.current_round = 0
+
+    @classmethod
+    def local(cls, room_id):
+        room_id = int(room_id)
+        state = cls._local.get(room_id)
+        if state is None:
+            state = cls._local[room_id] = cls(room_id)
+        return state
+
+    def key(self, *parts):
+        return ":".join(["room", str(self.room_id), *map(str, parts)])
+
+    # 방 존재 여부 (add_room에서 기록, 없으면 DB를 한 번 확인하고 캐시)
+    def mark_exists(self):
+        cache.set(self.key("exists"), True, self.timeout)
+
+    async def exists(self):
+        exists = await cache.aget(self.key("exists"))
+        if exists is None:
+            exists = await database_sync_to_async(Room.objects.filter(id=self.room_id).exists)()
+            await cache.aset(self.key("exists"), exists, self.timeout if exists else 60)
+        return exists
+
+    # 입장 거절 사유 (입장 가능하면 None)
+    async def check_admission(self):
+        if not await self.exists():
+            return self.NOT_FOUND
+        if await self.get_player_count() >= self.MAX_PLAYERS:
+            return self.FULL
+        if await self.get_round() >= 1:
+            return self.STARTED
+        return None
+
+    # 플레이어 목록 (생성 순서 = 릴레이 순서)
+    async def get_players(self):
+        players = await cache.aget(self.key("players"))
+        if players is None:
+            players = await self.refresh_players()
+        return players
+
+    async def refresh_players(self):
+        players = await database_sync_to_async(self.load_players)()
+        await cache.aset(self.key("players"), players, self.timeout)
+        return players
+
+    def load_players(self):
+        sub_rooms = (
+            SubRoom.objects.filter(room_id=self.room_id, delete_at=None)
+            .order_by("created_at")
+            .values("id", "first_player", "is_host")
+        )
+        return [
+            {
+                "player_id": sub_room["id"],
+                "name": sub_room["first_player"],
+                "isHost": sub_room["is_host"],
+            }
+            for sub_room in sub_rooms
+        ]
+
+    async def get_player_count(self):
+        return len(await self.get_players())
+
+    async def get_next_player_id(self, sub_room_id):
+        player_ids = [player["player_id"] for player in await self.get_players()]
+        if sub_room_id in player_ids:
+            return player_ids[(player_ids.index(sub_room_id) + 1) % len(player_ids)]
+
+        # 이미 나간 플레이어의 SubRoom이면 DB에 남아있는 next_room을 따라간다.
+        sub_room = await database_sync_to_async(SubRoom.objects.get)(id=sub_room_id)
+        return await database_sync_to_async(sub_room.get_next_id)()
+
+    async def rename_player(self, player_id, name):
+        updated = await database_sync_to_async(
+            SubRoom.objects.filter(id=player_id, room_id=self.room_id, delete_at=None).update
+        )(first_player=name)
+        if updated:
+            await self.refresh_players()
+        return bool(updated)
+
+    # 접속 확인 (플레이어마다 마지막으로 ping/pong을 받은 시각)
+    # 소켓마다 타이머를 두지 않고 방 코디네이터가 주기적으로 한 번에 확인한다.
+    async def touch(self, player_id):
+        await cache.aset(self.key("seen", player_id), time.time(), self.timeout)
+
+    async def get_stale_players(self, timeout):
+        player_ids = [player["player_id"] for player in await self.get_players()]
+        seen = await self.get_many("seen", player_ids)
+        now = time.time()
+
+        # 기록이 없는 플레이어(캐시가 비워진 경우 등)는 지금부터 다시 잰다.
+        unseen = [player_id for player_id in player_ids if player_id not in seen]
+        if unseen:
+            await cache.aset_many(
+                {self.key("seen", player_id): now for player_id in unseen}, self.timeout
+            )
+
+        return [player_id for player_id, last_seen in seen.items() if now - last_seen > timeout]
+
+    async def evict_players(self, player_ids):
+        remaining = await database_sync_to_async(SubRoom.evict)(self.room_id, player_ids)
+        await cache.adelete_many([self.key("seen", player_id) for player_id in player_ids])
+        await self.refresh_players()
+        return remaining
+
+    async def reset_presence(self):
+        now = time.time()
+        player_ids = [player["player_id"] for player in await self.get_players()]
+        await cache.aset_many(
+            {self.key("seen", player_id): now for player_id in player_ids}, self.timeout
+        )
+
+    async def forget_player(self, player_id):
+        await cache.adelete(self.key("seen", player_id))
+
+    # 라운드
+    async def get_round(self):
+        return await cache.aget(self.key("round"), 0)
+
+    async def set_round(self, round):
+        await cache.aset(self.key("round"), round, self.timeout)
+
+    # 라운드 완료 인원
+    # 라운드마다 별도 키를 두고 INCR(원자적 증가)만 사용하므로
+    # 여러 컨슈머가 동시에 제출해도 갱신이 유실되지 않는다.
+    async def get_complete_num(self, round):
+        return await cache.aget(self.key("complete", round), 0)
+
+    async def mark_complete(self, round, player_id):
+        # 같은 플레이어의 중복 제출은 한 번만 센다.
+        if not await cache.aadd(self.key("done", round, player_id), 1, self.timeout):
+            return await self.get_complete_num(round)
+
+        await cache.aadd(self.key("complete", round), 0, self.timeout)
+        return await cache.aincr(self.key("complete", round))
+
+    # 방에 남아있는 플레이어가 모두 제출했는지 (나간 플레이어의 제출은 세지 않는다)
+    async def is_round_complete(self, round):
+        player_ids = [player["player_id"] for player in await self.get_players()]
+        done = await cache.aget_many(
+            [self.key("done", round, player_id) for player_id in player_ids]
+        )
+        return bool(player_ids) and len(done) == len(player_ids)
+
+    async def claim_round(self, round):
+        # 라운드 종료 처리(로딩, 이미지 생성, 다음 라운드)를 한 컨슈머만 하도록 한다.
+        return await cache.aadd(self.key("claimed", round), 1, self.timeout)
+
+    async def is_round_claimed(self, round):
+        return await cache.aget(self.key("claimed", round)) is not None
+
+    async def get_completion(self):
+        round = await self.get_round()
+        return {
+            "round": round,
+            "completeNum": await self.get_complete_num(round),
+            "total": await self.get_player_count(),
+        }
+
+    # 주제 (SubRoom, 라운드 별로 하나)
+    async def get_topic(self, sub_room_id, round):
+        return await cache.aget(self.key("topic", sub_room_id, round))
+
+    # 주제의 DB 쓰기는 바로 하지 않고(write-behind) 캐시에만 반영한 뒤 변경 표시를 남긴다.
+    # flush_topics가 모아서 bulk_create / bulk_update 한다.
+    # (코디네이터 주기, 라운드 종료, 결과 조회, 방 정리 때, 그리고 flush_pending_topics 주기 작업)
+    async def add_topic(self, sub_room_id, round, title, player_id):
+        data = {"title": title, "player_id": player_id}
+        await cache.aset(self.key("topic", sub_room_id, round), data, self.timeout)
+        await self.mark_dirty(sub_room_id, round)
+        return data
+
+    # 라운드의 모든 주제 (SubRoom id -> 주제, 이미 나간 플레이어의 SubRoom 포함)
+    async def get_round_topics(self, round):
+        sub_room_ids = await database_sync_to_async(list)(
+            SubRoom.objects.filter(room_id=self.room_id).values_list("id", flat=True)
+        )
+        return await self.get_many("topic", sub_room_ids, round)
+
+    async def get_many(self, kind, sub_room_ids, *parts):
+        keys = {self.key(kind, sub_room_id, *parts): sub_room_id for sub_room_id in sub_room_ids}
+        values = await cache.aget_many(keys)
+        return {keys[key]: value for key, value in values.items()}
+
+    async def change_title(self, sub_room_id, round, title):
+        data = await self.get_topic(sub_room_id, round)
+        if data is None:
+            return None
+
+        # 제목이 바뀌면 이전 제목으로 만든 이미지는 쓰지 않는다.
+        data["title"] = title
+        await cache.aset(self.key("topic", sub_room_id, round), data, self.timeout)
+        await cache.adelete(self.key("url", sub_room_id, round))
+        await self.mark_dirty(sub_room_id, round)
+        return data
+
+    async def get_url(self, sub_room_id, round):
+        return await cache.aget(self.key("url", sub_room_id, round))
+
+    async def load_url(self, sub_room_id, round):
+        topic_id = await cache.aget(self.key("topic_id", sub_room_id, round))
+        if topic_id is None:
+            return None
+
+        url = await database_sync_to_async(
+            Topic.objects.filter(id=topic_id).values_list("url", flat=True).first
+        )()
+        if url is not None:
+            await cache.aset(self.key("url", sub_room_id, round), url, self.timeout)
+        return url
+
+    # 이미지 생성 작업 (주제마다 어떤 제목으로 시작했는지와 task id)
+    async def get_image_job(self, sub_room_id, round):
+        return await cache.aget(self.key("image_job", sub_room_id, round))
+
+    async def get_image_jobs(self, sub_room_ids, round):
+        return await self.get_many("image_job", sub_room_ids, round)
+
+    # task_ids: 체인의 모든 단계 id (제목이 바뀌면 아직 시작하지 않은 단계를 취소한다)
+    async def set_image_job(self, sub_room_id, round, title, task_id, task_ids=None):
+        job = {"title": title, "task_id": task_id, "task_ids": task_ids or [task_id]}
+        await cache.aset(self.key("image_job", sub_room_id, round), job, self.timeout)
+
+    async def clear_image_job(self, sub_room_id, round):
+        await cache.adelete(self.key("image_job", sub_room_id, round))
+
+    async def set_url(self, sub_room_id, round, url):
+        await cache.aset(self.key("url", sub_room_id, round), url, self.timeout)
+        # 마지막 라운드 이미지는 결과 조회보다 늦게 끝날 수 있으므로 캐시해 둔 결과를 버린다.
+        await cache.adelete(self.key("results"))
+        if await self.get_topic(sub_room_id, round) is not None:
+            await self.mark_dirty(sub_room_id, round)
+
+    # 변경 표시: 주제(SubRoom, 라운드)별 카운터와 방 전체 카운터를 INCR 한다.
+    # flush는 읽은 시점의 카운터 값을 "flushed"로 기록하므로, 그 사이에 생긴 변경은 다음 flush로 넘어간다.
+    # 방 카운터 값마다 바뀐 주제를 따로 남겨서 flush가 바뀐 주제만 확인하게 한다.
+    # (값마다 키가 달라 여러 컨슈머가 동시에 남겨도 서로 덮어쓰지 않는다)
+    async def mark_dirty(self, sub_room_id, round):
+        for key in (self.key("dirty", sub_room_id, round), self.key("dirty")):
+            await cache.aadd(key, 0, self.timeout)
+            version = await cache.aincr(key)
+        await cache.aset(self.key("dirty_slot", version), (sub_room_id, round), self.timeout)
+
+    # 여러 프로세스가 동시에 flush 해도 주제는 (SubRoom, 라운드)로 upsert 되므로 중복되지 않는다.
+    async def flush_topics(self):
+        room_version = await cache.aget(self.key("dirty"), 0)
+        flushed = await cache.aget(self.key("flushed"), 0)
+        if room_version == flushed:
+            return 0
+
+        log_keys = [
+            self.key("dirty_slot", version) for version in range(flushed + 1, room_version + 1)
+        ]
+        log = await cache.aget_many(log_keys)
+        if len(log) == len(log_keys):
+            slots = set(log.values())
+        else:
+            # 기록이 빠졌으면 (INCR 직후 아직 남기기 전이거나 캐시에서 밀려난 경우) 방의 모든 주제를 확인한다.
+            slots = await self.get_all_slots()
+
+        keys = [self.key(kind, *slot) for slot in slots for kind in ("dirty", "flushed")]
+        versions = await cache.aget_many(keys)
+        dirty = {}
+        for slot in slots:
+            version = versions.get(self.key("dirty", *slot), 0)
+            if version > versions.get(self.key("flushed", *slot), 0):
+                dirty[slot] = version
+
+        if dirty:
+            keys = [
+                self.key(kind, *slot) for slot in dirty for kind in ("topic", "url", "topic_id")
+            ]
+            values = await cache.aget_many(keys)
+            topic_ids = await database_sync_to_async(self.write_topics)(
+                {
+                    slot: {
+                        "topic": values.get(self.key("topic", *slot)),
+                        "url": values.get(self.key("url", *slot)),
+                        "id": values.get(self.key("topic_id", *slot)),
+                    }
+                    for slot in dirty
+                }
+            )
+            await cache.aset_many(
+                {self.key("topic_id", *slot): topic_id for slot, topic_id in topic_ids.items()},
+                self.timeout,
+            )
+            await cache.aset_many(
+                {self.key("flushed", *slot): version for slot, version in dirty.items()},
+                self.timeout,
+            )
+        await cache.aset(self.key("flushed"), room_version, self.timeout)
+        await cache.adelete_many(log_keys)
+        return len(dirty)
+
+    # 방의 모든 (SubRoom, 라운드) 조합 (이미 나간 플레이어의 SubRoom 포함)
+    async def get_all_slots(self):
+        sub_room_ids = await database_sync_to_async(list)(
+            SubRoom.objects.filter(room_id=self.room_id).values_list("id", flat=True)
+        )
+        rounds = range(1, len(sub_room_ids) + 1)
+        return {(sub_room_id, round) for round in rounds for sub_room_id in sub_room_ids}
+
+    # 새 주제는 bulk_create 한 번, 이미 저장된 주제는 bulk_update 한 번으로 쓴다.
+    # 새 주제는 (SubRoom, 라운드)로 upsert 하고 id는 그 키로 한 번에 다시 읽는다.
+    # (MySQL은 bulk_create에서 id를 돌려주지 않는다)
+    # (SubRoom, 라운드) -> 새로 만든 Topic id 를 반환한다. (이후에는 이 id로 고친다)
+    def write_topics(self, changes):
+        now = timezone.now()
+        creates, updates = {}, []
+        for slot, change in changes.items():
+            if change["topic"] is None:
+                continue
+            sub_room_id, round = slot
+            if change["id"] is None:
+                creates[slot] = Topic(
+                    title=change["topic"]["title"],
+                    url=change["url"],
+                    player_id=change["topic"]["player_id"],
+                    sub_room_id=sub_room_id,
+                    round=round,
+                )
+            else:
+                updates.append(
+                    Topic(
+                        id=change["id"],
+                        title=change["topic"]["title"],
+                        url=change["url"],
+                        update_at=now,
+                    )
+                )
+
+        topic_ids = {}
+        with transaction.atomic():
+            if creates:
+                # MySQL은 ON DUPLICATE KEY UPDATE 라서 충돌 키를 지정하지 않는다.
+                unique_fields = None
+                if connection.features.supports_update_conflicts_with_target:
+                    unique_fields = ["sub_room", "round"]
+                Topic.objects.bulk_create(
+                    creates.values(),
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=["title", "url", "player_id", "update_at"],
+                )
+                rows = Topic.objects.filter(
+                    sub_room_id__in={sub_room_id for sub_room_id, _ in creates},
+                    round__in={round for _, round in creates},
+                ).values_list("sub_room_id", "round", "id")
+                topic_ids = {
+                    (sub_room_id, round): topic_id
+                    for sub_room_id, round, topic_id in rows
+                    if (sub_room_id, round) in creates
+                }
+            if updates:
+                Topic.objects.bulk_update(updates, fields=["title", "url", "update_at"])
+
+        return topic_ids
+
+    # 게임 결과 (SubRoom id -> 릴레이 순서대로의 주제 목록)
+    async def get_results(self):
+        results = await cache.aget(self.key("results"))
+        if results is None:
+            await self.flush_topics()
+            results = await database_sync_to_async(self.load_results)()
+            await cache.aset(self.key("results"), results, self.timeout)
+        return results
+
+    def load_results(self):
+        topics = list(
+            Topic.objects.filter(sub_room__room_id=self.room_id, delete_at=None)
+            .order_by("round", "created_at", "id")
+            .values("sub_room_id", "title", "player_id", "url")
+        )
+        players = SubRoom.objects.in_bulk({topic["player_id"] for topic in topics})
+
+        results = {}
+        for topic in topics:
+            # topic 쓴 사람 찾음 (이미 나간 플레이어도 포함)
+            player = players.get(topic["player_id"])
+            results.setdefault(topic["sub_room_id"], []).append(
+                {
+                    "title": topic["title"],
+                    "player_name": player.first_player if player else "",
+                    "img": topic["url"],
+                }
+            )
+        return results
+
+    async def claim_result_broadcast(self, player_id):
+        return await cache.aadd(self.key("result_sent", player_id), 1, 3)
+
+    # 새 게임 시작 / 방 정리
+    async def reset_game(self):
+        # 이전 게임의 주제를 먼저 DB에 쓴다.
+        await self.flush_topics()
+
+        players = await self.get_players()
+        rounds = range(1, len(players) + 1)
+        keys = [
+            self.key(kind, player["player_id"], round)
+            for kind in ("topic", "url", "image_job", "topic_id", "dirty", "flushed")
+            for player in players
+            for round in rounds
+        ]
+        keys += [
+            self.key("done", round, player["player_id"]) for player in players for round in rounds
+        ]
+        keys += [self.key(kind, round) for kind in ("complete", "claimed") for round in rounds]
+        keys.append(self.key("results"))
+        await cache.adelete_many(keys)
+        await self.set_round(1)
+
+    async def clear(self):
+        await self.reset_game()
+        await cache.adelete_many([self.key("players"), self.key("round")])
@@ -1,27 +1,97 @@
 import os
+import base64
+import random
+import time
 import uuid
+import logging
 from celery import shared_task
 import openai
 import requests
+from asgiref.sync import async_to_sync
+from celery import chain, current_app, group
+from celery.result import AsyncResult
+from channels.layers import get_channel_layer
+from celery.exceptions import Retry
 from openai import InvalidRequestError
-from storages.backends.s3boto3 import S3Boto3Storage
-from datetime import datetime
+from openai.error import RateLimitError
+from requests.adapters import HTTPAdapter
+import boto3
+from botocore.config import Config
+from datetime import datetime, timedelta
+from io import BytesIO
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from myapp import image_cache, metrics, protocol
 from myapp.models import Room, SubRoom, Topic
+from myapp.rate_limit import InFlightLimit, RateLimiter
+from myapp.room_state import RoomState
+from myapp.translation import get_translator
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
-client_id = os.getenv("NAVER_CLIENT_ID")
-client_secret = os.getenv("NAVER_CLIENT_SECRET")
-AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
-AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
+
+logger = logging.getLogger(__name__)
+
+
+# OpenAI 이미지 생성 한도 (모든 워커 공용)
+image_rate_limiter = RateLimiter(
+    "openai_images", settings.IMAGE_RATE_LIMIT, settings.IMAGE_RATE_PERIOD
+)
 
 
 @shared_task(bind=True, max_retries=3)
-def create_image(self, title):
+def create_image(self, title, room_id=None):
     try:
-        response = openai.Image.create(prompt=title, n=1, size="256x256")
-        image_url = response["data"][0]["url"]
-        s3_image_url = upload_image_to_s3(image_url, "image")
-        return f"https://{AWS_STORAGE_BUCKET_NAME}.s3-{AWS_S3_REGION_NAME}.amazonaws.com/{s3_image_url}"
+        size = settings.IMAGE_SIZE
+        use_cache = room_id is None or Room.objects.filter(id=room_id, image_cache=True).exists()
+        if use_cache:
+            s3_image_url = image_cache.get(title, size)
+            if s3_image_url is not None:
+                return s3_url(s3_image_url)
+
+        # 한 방이 이미지 워커를 독점하지 않도록 방마다 동시에 만드는 이미지 수를 제한한다.
+        # 방 한도에 막힌 작업이 전체 요청 한도를 쓰지 않도록 먼저 확인한다.
+        room_limit = None
+        if room_id is not None:
+            room_limit = InFlightLimit(
+                "room:%s:images" % room_id,
+                settings.ROOM_IMAGE_IN_FLIGHT,
+                settings.IMAGE_READY_TIMEOUT,
+            )
+            if not room_limit.acquire():
+                raise self.retry(countdown=1 + random.random(), max_retries=None)
+
+        # 한도를 넘으면 실패시키지 않고 다음 구간으로 미뤄 다시 실행한다.
+        wait = image_rate_limiter.acquire()
+        if wait:
+            if room_limit is not None:
+                room_limit.release()
+            raise self.retry(countdown=wait + random.random(), max_retries=None)
+
+        metrics.IMAGE_JOBS_IN_FLIGHT.inc()
+        try:
+            response_format = settings.IMAGE_RESPONSE_FORMAT
+            response = openai.Image.create(
+                prompt=title, n=1, size=size, response_format=response_format
+            )
+            if response_format == "b64_json":
+                s3_image_url = upload_image_data_to_s3(response["data"][0]["b64_json"], "image")
+            else:
+                s3_image_url = upload_image_to_s3(response["data"][0]["url"], "image")
+        finally:
+            metrics.IMAGE_JOBS_IN_FLIGHT.dec()
+            if room_limit is not None:
+                room_limit.release()
+
+        if use_cache:
+            image_cache.put(title, size, s3_image_url)
+        return s3_url(s3_image_url)
+    except Retry:
+        raise
+    except RateLimitError as e:
+        # OpenAI가 한도 초과를 알려오면 점점 늦춰 다시 시도한다.
+        raise self.retry(exc=e, countdown=2**self.request.retries + random.random())
     except InvalidRequestError as e:
         error_message = f"OpenAI API returned an error: {e}."
         print(error_message)
@@ -34,55 +104,291 @@ def create_image(self, title):
 
 @shared_task
 def translate_text(text):
-    url = "https://openapi.naver.com/v1/papago/n2mt"
-
-    headers = {
-        "X-Naver-Client-Id": client_id,
-        "X-Naver-Client-Secret": client_secret,
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-    }
-
-    data = {
-        "source": "ko",
-        "target": "en",
-        "text": text,
-    }
-
-    response = requests.post(url, headers=headers, data=data)
-    response_data = response.json()
-
-    if response.status_code == 200:
-        translated_text = response_data["message"]["result"]["translatedText"]
-        return translated_text
+    return get_translator().translate(text)
+
+
+# 번역 -> 이미지 생성 -> 결과 저장/알림을 하나의 체인으로 만든다.
+# prefetch: 제목을 내자마자 미리 시작한 작업 (실패해도 라운드 중에는 알리지 않는다)
+def image_pipeline(room_id, sub_room_id, round, title, prefetch=False):
+    # 이미 번역된 적 있는 제목이면 번역 작업 없이 바로 이미지 생성으로 넘어간다.
+    translated_text = get_translator().cached(title)
+    if translated_text is not None:
+        steps = [create_image.s(translated_text, room_id=room_id)]
     else:
-        # 처리 실패 시 예외 처리 등을 수행할 수 있습니다.
-        raise Exception("Translation failed")
+        steps = [translate_text.s(title), create_image.s(room_id=room_id)]
+
+    pipeline = chain(*steps, save_image_url.s(room_id, sub_room_id, round, title, prefetch))
+    return pipeline.on_error(image_pipeline_failed.s(room_id, sub_room_id, round, prefetch))
+
+
+# 컨슈머는 결과를 기다리지 않고, 완료되면 채널 레이어로 image_ready 이벤트를 받는다.
+def start_image_pipeline(room_id, sub_room_id, round, title):
+    return image_pipeline(room_id, sub_room_id, round, title, prefetch=True).apply_async()
+
+
+# 체인 결과는 마지막 단계(save_image_url)이므로 parent를 따라가며 앞 단계의 id도 모은다.
+def pipeline_task_ids(result):
+    task_ids = [result.id]
+    parent = getattr(result, "parent", None)
+    while isinstance(parent, AsyncResult):
+        task_ids.append(parent.id)
+        parent = parent.parent
+    return task_ids
+
+
+# 제목이 바뀌어 필요 없어진 체인을 취소한다.
+# 아직 시작하지 않은 단계(대기 중인 create_image 등)는 실행되지 않아 이미지 생성 비용이 들지 않는다.
+# 이미 실행 중인 단계는 끝까지 돌고, 결과는 save_image_url에서 버린다.
+def revoke_image_pipeline(job):
+    current_app.control.revoke(job.get("task_ids", [job["task_id"]]))
+
+
+# 라운드가 끝나면 방의 모든 주제(나간 플레이어의 주제 포함) 이미지를 하나의 group으로 만든다.
+# 소켓과 무관하게 워커에서 실행되며, 같은 제목으로 이미 시작된 작업
+# (미리 만들기, 재시도 전에 보낸 작업)은 다시 보내지 않는다.
+# 반환값: SubRoom id -> 해당 이미지 작업의 task id
+@shared_task(bind=True, max_retries=3)
+def generate_round_images(self, room_id, round):
+    state = RoomState(room_id)
+    try:
+        topics = async_to_sync(state.get_round_topics)(round)
+        jobs = async_to_sync(state.get_image_jobs)(topics, round)
+
+        task_ids = {}
+        pending = []
+        for sub_room_id, topic in topics.items():
+            job = jobs.get(sub_room_id)
+            if job is not None and job["title"] == topic["title"]:
+                task_ids[sub_room_id] = job["task_id"]
+            else:
+                if job is not None:
+                    revoke_image_pipeline(job)
+                pending.append((sub_room_id, topic["title"]))
+
+        if pending:
+            pipelines = [
+                image_pipeline(room_id, sub_room_id, round, title) for sub_room_id, title in pending
+            ]
+            result = group(pipelines).apply_async()
+            for (sub_room_id, title), item in zip(pending, result.results):
+                async_to_sync(state.set_image_job)(
+                    sub_room_id, round, title, item.id, pipeline_task_ids(item)
+                )
+                task_ids[sub_room_id] = item.id
+
+        logger.info(
+            "room %s round %s images: %d started, %d reused",
+            room_id,
+            round,
+            len(pending),
+            len(task_ids) - len(pending),
+        )
+        return task_ids
+    except Exception as e:
+        logger.error(f"Failed to start round images: {e}")
+        raise self.retry(exc=e, countdown=1)
+
+
+@shared_task
+def save_image_url(image_url, room_id, sub_room_id, round, title=None, prefetch=False):
+    state = RoomState(room_id)
+
+    # 미리 시작한 작업이 끝나기 전에 제목이 바뀌었으면 결과를 버린다.
+    # (이미지는 image_cache에 남아 같은 제목으로 되돌리면 다시 쓰인다.)
+    if title is not None:
+        topic = async_to_sync(state.get_topic)(sub_room_id, round)
+        if topic is not None and topic["title"] != title:
+            return image_url
+
+    if isinstance(image_url, dict) and "error" in image_url:
+        report_image_failure(state, sub_room_id, round, "AI가 만들 수 없는 주제 입니다.", prefetch)
+        return image_url
+
+    async_to_sync(state.set_url)(sub_room_id, round, image_url)
+    async_to_sync(get_channel_layer().group_send)(
+        state.group_name,
+        {
+            "type": "image_ready",
+            "message": {"sub_room_id": sub_room_id, "round": round, "url": image_url},
+        },
+    )
+    return image_url
+
+
+@shared_task
+def image_pipeline_failed(
+    request, exc, traceback, room_id, sub_room_id=None, round=None, prefetch=False
+):
+    error_message = f"An unexpected error occurred: {exc}"
+    logger.error(error_message)
 
+    report_image_failure(RoomState(room_id), sub_room_id, round, error_message, prefetch)
 
+
+def report_image_failure(state, sub_room_id, round, error_message, prefetch):
+    if sub_room_id is not None:
+        # 라운드가 끝날 때 다시 시도할 수 있도록 작업 기록을 지운다.
+        async_to_sync(state.clear_image_job)(sub_room_id, round)
+
+    # 미리 만들던 이미지는 라운드 중에 방 전체에 알리지 않는다. (generate_round_images가 다시 만든다)
+    # 이미 라운드가 끝나 그 작업을 기다리는 중이면 라운드 종료 작업과 같이 알린다.
+    if prefetch and not async_to_sync(state.is_round_claimed)(round):
+        logger.info("room %s prefetch image failed: %s", state.room_id, error_message)
+        return
+
+    async_to_sync(get_channel_layer().group_send)(
+        state.group_name,
+        protocol.group_event(
+            "image_created_fail",
+            {
+                "event": "image_creation_failed",
+                "data": {"error": error_message},
+            },
+        ),
+    )
+
+
+def s3_url(s3_image_url):
+    return f"https://{settings.AWS_STORAGE_BUCKET_NAME}.s3-{settings.AWS_S3_REGION_NAME}.amazonaws.com/{s3_image_url}"
+
+
+# 이미지 다운로드/OpenAI용 HTTP 세션과 S3 클라이언트는 프로세스마다 하나만 만들어 재사용한다.
+# gevent 워커(-P gevent)에서는 모든 태스크가 이 커넥션 풀을 나눠 쓰므로
+# 풀 크기(EXTERNAL_API_POOL_SIZE)를 워커 동시성에 맞춘다.
+_http_session = None
+_s3_client = None
+
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.EXTERNAL_API_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+    return _http_session
+
+
+# openai는 스레드(그린렛)마다 세션을 새로 만들기 때문에 공유 세션을 쓰도록 한다.
+openai.requestssession = get_http_session
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client(
+            "s3",
+            region_name=settings.AWS_S3_REGION_NAME,
+            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+            config=Config(max_pool_connections=settings.EXTERNAL_API_POOL_SIZE),
+        )
+    return _s3_client
+
+
+def make_s3_key(filename):
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    random_string = str(uuid.uuid4().hex[:6])
+    return f"images/{filename}_{now}_{random_string}.png"
+
+
+# 생성된 이미지를 메모리에 모으지 않고 다운로드 스트림을 그대로 S3(멀티파트)로 올린다.
 def upload_image_to_s3(image_url, filename):
-    from io import BytesIO
-    import requests
-
-    response = requests.get(image_url)
-    if response.status_code == 200:
-        image_data = BytesIO(response.content)
-        storage = S3Boto3Storage()
-        now = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_string = str(uuid.uuid4().hex[:6])
-        unique_filename = f"images/{filename}_{now}_{random_string}.png"
-        s3_image_url = storage.save(unique_filename, image_data)
+    with get_http_session().get(image_url, stream=True, timeout=30) as response:
+        if response.status_code != 200:
+            # 처리 실패 시 예외 처리 등을 수행할 수 있습니다.
+            raise Exception("Failed to upload image to S3")
+
+        response.raw.decode_content = True
+        s3_image_url = make_s3_key(filename)
+        get_s3_client().upload_fileobj(
+            response.raw,
+            settings.AWS_STORAGE_BUCKET_NAME,
+            s3_image_url,
+            ExtraArgs={"ContentType": "image/png"},
+        )
         return s3_image_url
-    else:
-        # 처리 실패 시 예외 처리 등을 수행할 수 있습니다.
-        raise Exception("Failed to upload image to S3")
 
 
+# IMAGE_RESPONSE_FORMAT = "b64_json" 일 때: OpenAI 응답의 이미지 바이트를 다시 받지 않고 바로 올린다.
+def upload_image_data_to_s3(b64_image, filename):
+    s3_image_url = make_s3_key(filename)
+    get_s3_client().upload_fileobj(
+        BytesIO(base64.b64decode(b64_image)),
+        settings.AWS_STORAGE_BUCKET_NAME,
+        s3_image_url,
+        ExtraArgs={"ContentType": "image/png"},
+    )
+    return s3_image_url
+
+
+# 오래된 방을 pk 구간 단위로 나눠서 지운다.
+# 삭제(delete_at)된 지 CLEAR_DATA_DELETED_AGE 가 지난 방과, 끝내 닫히지 않은 채
+# CLEAR_DATA_STALE_AGE 가 지난 방이 대상이며, 하위 SubRoom/Topic은 행 단위 조회 없이 한 번에 지운다.
+@shared_task
+def clear_data(batch_size=None):
+    batch_size = batch_size or settings.CLEAR_DATA_BATCH_SIZE
+    now = timezone.now()
+    deleted_before = now - timedelta(seconds=settings.CLEAR_DATA_DELETED_AGE)
+    stale_before = now - timedelta(seconds=settings.CLEAR_DATA_STALE_AGE)
+    expired = Q(delete_at__lt=deleted_before) | Q(delete_at=None, created_at__lt=stale_before)
+
+    started = time.monotonic()
+    total = {"rooms": 0, "sub_rooms": 0, "topics": 0, "batches": 0}
+    last_pk = 0
+    while True:
+        room_ids = list(
+            Room.objects.filter(expired, pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not room_ids:
+            break
+        last_pk = room_ids[-1]
+
+        batch_started = time.monotonic()
+        with transaction.atomic():
+            sub_room_ids = list(
+                SubRoom.objects.filter(room_id__in=room_ids).values_list("pk", flat=True)
+            )
+            topics = raw_delete(Topic.objects.filter(sub_room_id__in=sub_room_ids))
+            # next_room 자기 참조 FK 때문에 링을 먼저 끊고 지운다.
+            SubRoom.objects.filter(pk__in=sub_room_ids).update(next_room=None)
+            sub_rooms = raw_delete(SubRoom.objects.filter(pk__in=sub_room_ids))
+            rooms = raw_delete(Room.objects.filter(pk__in=room_ids))
+
+        total["rooms"] += rooms
+        total["sub_rooms"] += sub_rooms
+        total["topics"] += topics
+        total["batches"] += 1
+        logger.info(
+            f"clear_data batch {total['batches']}: rooms={rooms} sub_rooms={sub_rooms} "
+            f"topics={topics} ({time.monotonic() - batch_started:.3f}s)"
+        )
+
+    total["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(f"clear_data done: {total}")
+    return total
+
+
+# CASCADE 조회/시그널 없이 DELETE 한 번으로 지우고 삭제된 행 수를 반환한다.
+def raw_delete(queryset):
+    return queryset._raw_delete(queryset.db)
+
+
+# 열려 있는 방들의 주제 변경(write-behind) 중 아직 DB에 쓰지 않은 것을 쓴다.
+# 보통은 방 코디네이터가 쓰지만, 코디네이터를 돌리던 프로세스가 종료된 방도 캐시(Redis)에 남은 변경이 유실되지 않게 한다.
 @shared_task
-def clear_data():
-    for room in Room.objects.all():
-        room.hard_delete()
-    for sub_room in SubRoom.objects.all():
-        sub_room.hard_delete()
-    for topic in Topic.objects.all():
-        topic.hard_delete()
-        
\ No newline at end of file
+def flush_pending_topics():
+    room_ids = list(Room.objects.filter(delete_at=None).values_list("pk", flat=True))
+    topics = async_to_sync(flush_rooms)(room_ids)
+    if topics:
+        logger.info(f"flush_pending_topics: rooms={len(room_ids)} topics={topics}")
+    return topics
+
+
+async def flush_rooms(room_ids):
+    topics = 0
+    for room_id in room_ids:
+        topics += await RoomState(room_id).flush_topics()
+    return topics
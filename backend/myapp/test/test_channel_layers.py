@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import SimpleTestCase, override_settings
+from fakeredis import TcpFakeServer
+from config.affinity import RoomAffinityChannelLayer
+from config.channel_layers import parse_hosts, redis_channel_layer
+
+
+# 실제 Redis 대신 Redis 프로토콜로 통신하는 fakeredis 서버 두 대를 샤드로 띄운다.
+class ShardedChannelLayerTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = []
+        for _ in range(2):
+            server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers.append(server)
+        cls.hosts = ",".join("127.0.0.1:%d" % server.server_address[1] for server in cls.servers)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+            server.server_close()
+        super().tearDownClass()
+
+    def test_parse_hosts(self):
+        self.assertEqual(
+            parse_hosts("redis-a:6380, redis-b", max_connections=500),
+            [
+                {"host": "redis-a", "port": 6380, "max_connections": 500},
+                {"host": "redis-b", "port": 6379, "max_connections": 500},
+            ],
+        )
+
+    def test_capacity_only_for_core(self):
+        self.assertEqual(
+            redis_channel_layer("redis", "core", capacity=1000)["CONFIG"]["capacity"], 1000
+        )
+        self.assertNotIn(
+            "capacity", redis_channel_layer("redis", "pubsub", capacity=1000)["CONFIG"]
+        )
+
+    def test_group_send_across_shards(self):
+        shard_keys = self.check_fan_out("core")
+
+        # 방 그룹이 두 샤드에 나뉘어 저장된다.
+        self.assertTrue(all(shard_keys))
+        self.assertEqual(sum(map(len, shard_keys)), 20)
+
+    def test_pubsub_group_send_across_shards(self):
+        self.check_fan_out("pubsub")
+
+    def test_affinity_group_send_skips_redis_for_local_channels(self):
+        shard_keys = self.check_fan_out("affinity")
+        self.assertEqual(sum(map(len, shard_keys)), 20)
+
+        async def send_from_two_processes():
+            # 같은 Redis를 쓰는 두 워커 프로세스
+            here = RoomAffinityChannelLayer(hosts=parse_hosts(self.hosts))
+            there = RoomAffinityChannelLayer(hosts=parse_hosts(self.hosts))
+            local = [await here.new_channel() for _ in range(5)]
+            remote = await there.new_channel()
+            for channel in local + [remote]:
+                await here.group_add("main_room_1", channel)
+
+            # 이 프로세스 채널들이 receive 대기 중일 때만 빠른 경로를 탄다.
+            receives = [asyncio.ensure_future(here.receive(channel)) for channel in local]
+            await asyncio.sleep(0.1)
+            await here.group_send("main_room_1", {"type": "heartbeat", "n": 1})
+
+            for message in await asyncio.wait_for(asyncio.gather(*receives), 3):
+                self.assertEqual(message["n"], 1)
+            self.assertEqual((await asyncio.wait_for(there.receive(remote), 3))["n"], 1)
+
+            # 이 프로세스의 채널 키에는 아무것도 쓰지 않았다.
+            local_key = here.prefix + here.non_local_name(local[0])
+            self.assertFalse(
+                any(
+                    redis.Redis(*server.server_address).exists(local_key) for server in self.servers
+                )
+            )
+            await here.flush()
+            await there.flush()
+
+        async_to_sync(send_from_two_processes)()
+
+    def check_fan_out(self, backend):
+        config = {"default": redis_channel_layer(self.hosts, backend)}
+        with override_settings(CHANNEL_LAYERS=config):
+            layer = get_channel_layer()
+            async_to_sync(self.fan_out)(layer)
+            shard_keys = [
+                redis.Redis(*server.server_address).keys("asgi:group:main_room_*")
+                for server in self.servers
+            ]
+            async_to_sync(layer.flush)()
+        return shard_keys
+
+    async def fan_out(self, layer, rooms=20, players=6):
+        groups = {}
+        for room in range(rooms):
+            group = "main_room_%d" % room
+            groups[group] = [await layer.new_channel() for _ in range(players)]
+            for channel in groups[group]:
+                await layer.group_add(group, channel)
+
+        for group in groups:
+            await layer.group_send(group, {"type": "heartbeat", "room": group})
+
+        for group, channels in groups.items():
+            for channel in channels:
+                message = await asyncio.wait_for(layer.receive(channel), 3)
+                self.assertEqual(message["room"], group)
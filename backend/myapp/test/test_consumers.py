@@ -0,0 +1,222 @@
+from unittest import mock
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from myapp import protocol
+from myapp.models import Room, SubRoom
+from myapp.room_state import RoomState
+from myapp.routing import websocket_urlpatterns
+
+application = URLRouter(websocket_urlpatterns)
+
+
+class RoomConsumerAdmissionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.state = RoomState(self.room.id)
+        self.state.mark_exists()
+
+    async def test_connect_joins_room(self):
+        communicator = WebsocketCommunicator(application, f"/ws/room/{self.room.id}/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        message = await communicator.receive_json_from()
+        self.assertEqual(message["event"], "connected")
+        message = await communicator.receive_json_from()
+        self.assertEqual(message["event"], "renewList")
+        self.assertEqual(len(message["data"]["players"]), 1)
+
+        await communicator.disconnect()
+
+    async def test_unknown_room_is_rejected_before_accept(self):
+        communicator = WebsocketCommunicator(application, "/ws/room/999999/")
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    def test_full_room_is_rejected_without_db_queries(self):
+        for _ in range(RoomState.MAX_PLAYERS):
+            SubRoom.add_subroom(self.room)
+        async_to_sync(self.state.refresh_players)()
+
+        with self.assertNumQueries(0):
+            message = async_to_sync(self.connect_and_receive)()
+        self.assertEqual(message, {"event": "error", "data": {"error": RoomState.FULL}})
+
+    def test_started_room_is_rejected(self):
+        SubRoom.add_subroom(self.room)
+        async_to_sync(self.state.set_round)(1)
+
+        message = async_to_sync(self.connect_and_receive)()
+        self.assertEqual(message["data"]["error"], RoomState.STARTED)
+
+    async def connect_and_receive(self):
+        communicator = WebsocketCommunicator(application, f"/ws/room/{self.room.id}/")
+        await communicator.connect()
+        message = await communicator.receive_json_from()
+        await communicator.wait()
+        return message
+
+
+class RoomConsumerMsgpackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        RoomState(self.room.id).mark_exists()
+
+    @override_settings(WS_COALESCE_WINDOW=0.2)
+    async def test_events_are_coalesced_into_one_frame(self):
+        communicator = WebsocketCommunicator(
+            application, f"/ws/room/{self.room.id}/", subprotocols=[protocol.MSGPACK]
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, protocol.MSGPACK)
+
+        # 입장 직후의 connected, renewList(와 첫 heartbeat)가 한 프레임으로 온다.
+        events = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual([event["event"] for event in events][:2], ["connected", "renewList"])
+
+        await communicator.send_to(bytes_data=msgpack.packb({"event": "ping"}))
+        events = msgpack.unpackb(await communicator.receive_from())
+        self.assertIn({"event": "pong", "data": "pong"}, events)
+
+        await communicator.disconnect()
+
+
+# 플레이어 소켓으로 방에 들어가고, 원하는 메시지가 올 때까지 받는다.
+class PlayerMixin:
+    async def join(self):
+        communicator = WebsocketCommunicator(application, f"/ws/room/{self.room.id}/")
+        await communicator.connect()
+        message = await self.receive(communicator, "event", "connected")
+        return communicator, message["data"]["playerId"]
+
+    async def receive(self, communicator, key, value):
+        while True:
+            message = await communicator.receive_json_from(timeout=3)
+            if message.get(key) == value:
+                return message
+
+
+@mock.patch("myapp.consumers.generate_round_images")
+@mock.patch("myapp.consumers.start_image_pipeline")
+class RoomConsumerImagePrefetchTest(PlayerMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        RoomState(self.room.id).mark_exists()
+
+    async def test_images_start_on_submit(self, start_image_pipeline, generate_round_images):
+        start_image_pipeline.side_effect = lambda *args: mock.Mock(
+            id="task-%d" % start_image_pipeline.call_count
+        )
+        generate_round_images.delay.return_value = mock.Mock(id="round-1")
+        first, first_id = await self.join()
+        second, second_id = await self.join()
+
+        await first.send_json_to({"event": "startGame"})
+        await self.receive(second, "event", "gameStart")
+        await first.send_json_to(
+            {"event": "inputTitle", "data": {"title": "고양이", "playerId": first_id}}
+        )
+        await self.receive(first, "event", "completeUpdate")
+
+        # 제목을 바꾸면 예전 작업을 취소하고 바뀐 제목으로 다시 만들고, 같은 제목이면 다시 만들지 않는다.
+        with mock.patch("myapp.consumers.revoke_image_pipeline") as revoke_image_pipeline:
+            await first.send_json_to({"event": "changeTitle", "data": {"title": "강아지"}})
+            await first.send_json_to({"event": "changeTitle", "data": {"title": "강아지"}})
+            await first.send_json_to({"event": "getState"})
+            await self.receive(first, "event", "syncState")
+        revoke_image_pipeline.assert_called_once_with(
+            {"title": "고양이", "task_id": "task-1", "task_ids": ["task-1"]}
+        )
+
+        await second.send_json_to(
+            {"event": "inputTitle", "data": {"title": "사과", "playerId": second_id}}
+        )
+
+        # 라운드가 끝나면 방 전체 이미지 작업을 한 번만 보낸다.
+        started = await self.receive(first, "message", "Image creation started")
+        self.assertEqual(started["task_id"], "round-1")
+        started = await self.receive(second, "message", "Image creation started")
+        self.assertEqual(started["task_id"], "round-1")
+        generate_round_images.delay.assert_called_once_with(self.room.id, 1)
+
+        self.assertEqual(
+            [call.args for call in start_image_pipeline.call_args_list],
+            [
+                (self.room.id, first_id, 1, "고양이"),
+                (self.room.id, first_id, 1, "강아지"),
+                (self.room.id, second_id, 1, "사과"),
+            ],
+        )
+
+        await first.disconnect()
+        await second.disconnect()
+
+
+@override_settings(ROOM_STATUS_INTERVAL=0.05, PRESENCE_TIMEOUT=30)
+@mock.patch("myapp.consumers.generate_round_images")
+@mock.patch("myapp.consumers.start_image_pipeline")
+class RoomConsumerPresenceTest(PlayerMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.state = RoomState(self.room.id)
+        self.state.mark_exists()
+
+    async def test_stale_player_is_evicted_and_round_resumes(
+        self, start_image_pipeline, generate_round_images
+    ):
+        start_image_pipeline.return_value = mock.Mock(id="task")
+        generate_round_images.delay.return_value = mock.Mock(id="round-1")
+        first, first_id = await self.join()
+        second, second_id = await self.join()
+
+        await first.send_json_to({"event": "startGame"})
+        await self.receive(second, "event", "gameStart")
+        await first.send_json_to(
+            {"event": "inputTitle", "data": {"title": "고양이", "playerId": first_id}}
+        )
+        await self.receive(first, "event", "completeUpdate")
+
+        # second는 응답이 끊긴 상태 (마지막 pong이 오래 전)
+        await cache.aset(self.state.key("seen", second_id), 0)
+
+        players = await self.receive(first, "event", "renewList")
+        self.assertEqual([player["player_id"] for player in players["data"]["players"]], [first_id])
+        while (await second.receive_output(timeout=3))["type"] != "websocket.close":
+            pass
+
+        # second를 기다리며 멈춰 있던 라운드가 끝난다.
+        await self.receive(first, "event", "loading_and_url")
+        generate_round_images.delay.assert_called_once_with(self.room.id, 1)
+
+        await first.disconnect()
+
+    async def test_leaving_last_pending_player_ends_round(
+        self, start_image_pipeline, generate_round_images
+    ):
+        start_image_pipeline.return_value = mock.Mock(id="task")
+        generate_round_images.delay.return_value = mock.Mock(id="round-1")
+        first, first_id = await self.join()
+        second, _ = await self.join()
+
+        await first.send_json_to({"event": "startGame"})
+        await self.receive(second, "event", "gameStart")
+        await first.send_json_to(
+            {"event": "inputTitle", "data": {"title": "고양이", "playerId": first_id}}
+        )
+        await self.receive(first, "event", "completeUpdate")
+
+        # 아직 제출하지 않은 second가 나가면 라운드가 끝난다.
+        await second.disconnect()
+        await self.receive(first, "event", "loading_and_url")
+        generate_round_images.delay.assert_called_once_with(self.room.id, 1)
+
+        await first.disconnect()
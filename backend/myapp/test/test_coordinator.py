@@ -0,0 +1,94 @@
+import asyncio
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from myapp import coordinator
+from myapp.models import Room, SubRoom
+from myapp.room_state import RoomState
+
+
+@override_settings(ROOM_STATUS_INTERVAL=0.01, ROOM_PING_INTERVAL=60)
+class RoomCoordinatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.sub_room = SubRoom.add_subroom(self.room)
+        self.state = RoomState(self.room.id)
+        async_to_sync(self.state.refresh_players)()
+
+    async def test_one_coordinator_per_room(self):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(self.state.group_name, channel_name)
+        await self.state.set_round(1)
+
+        task = await coordinator.ensure_coordinator(self.state)
+        self.assertIsNotNone(task)
+        self.assertIs(await coordinator.ensure_coordinator(self.state), task)
+
+        # 다른 프로세스의 컨슈머는 락을 얻지 못한다.
+        other = coordinator.RoomCoordinator(RoomState(self.room.id))
+        self.assertFalse(await other.acquire())
+
+        heartbeat = await channel_layer.receive(channel_name)
+        self.assertEqual(heartbeat["type"], "heartbeat")
+        progress = await channel_layer.receive(channel_name)
+        self.assertEqual(progress["message"], {"event": "gameProgress", "data": 1})
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.assertTrue(await other.acquire())
+
+    async def test_new_coordinator_does_not_evict_connected_players(self):
+        second = await SubRoom.objects.acreate(room=self.room, first_player="플레이어 2")
+        await self.state.refresh_players()
+        # 이전 코디네이터가 멈춰 있던 동안 pong이 오지 않았다.
+        for sub_room in (self.sub_room, second):
+            await cache.aset(self.state.key("seen", sub_room.id), time.time() - 40)
+
+        with override_settings(PRESENCE_TIMEOUT=30):
+            task = await coordinator.ensure_coordinator(self.state)
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self.assertEqual(len(await self.state.get_players()), 2)
+
+    async def test_transient_error_does_not_stop_coordinator(self):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(self.state.group_name, channel_name)
+        await self.state.set_round(1)
+
+        get_players = RoomState.get_players
+        calls = []
+
+        # 첫 주기에만 캐시 오류가 난다.
+        async def flaky_get_players(state):
+            calls.append(state)
+            if len(calls) == 1:
+                raise ConnectionError("cache down")
+            return await get_players(state)
+
+        task = await coordinator.ensure_coordinator(self.state)
+        with mock.patch.object(RoomState, "get_players", flaky_get_players):
+            heartbeat = await channel_layer.receive(channel_name)
+        self.assertEqual(heartbeat["type"], "heartbeat")
+        self.assertFalse(task.done())
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def test_renew_does_not_take_over_another_lease(self):
+        first = coordinator.RoomCoordinator(self.state)
+        self.assertTrue(await first.acquire())
+        # 락이 만료되고 다른 프로세스가 새로 잡았다.
+        await cache.adelete(first.lock_key)
+        second = coordinator.RoomCoordinator(RoomState(self.room.id))
+        self.assertTrue(await second.acquire())
+
+        self.assertFalse(await first.renew())
+        self.assertTrue(await second.renew())
@@ -0,0 +1,37 @@
+import asyncio
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+from myapp import image_ready
+from myapp.models import Room, SubRoom, Topic
+from myapp.room_state import RoomState
+
+
+class ImageReadyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.sub_room = SubRoom.add_subroom(self.room)
+        self.state = RoomState(self.room.id)
+        self.topic = async_to_sync(self.state.add_topic)(
+            self.sub_room.id, 1, "고양이", self.sub_room.id
+        )
+
+    async def test_notify_wakes_waiter(self):
+        waiter = asyncio.create_task(
+            image_ready.wait_for_url(self.state, self.sub_room.id, 1, timeout=5)
+        )
+        await asyncio.sleep(0)
+
+        image_ready.notify(self.room.id, self.sub_room.id, 1, "https://example.com/cat.png")
+        self.assertEqual(await waiter, "https://example.com/cat.png")
+
+    def test_timeout_falls_back_to_db(self):
+        async_to_sync(self.state.flush_topics)()
+        Topic.objects.filter(sub_room=self.sub_room).update(url="https://example.com/cat.png")
+
+        wait_for_url = async_to_sync(image_ready.wait_for_url)
+        self.assertEqual(
+            wait_for_url(self.state, self.sub_room.id, 1, timeout=0.01),
+            "https://example.com/cat.png",
+        )
@@ -0,0 +1,86 @@
+from unittest import mock
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase
+from prometheus_client import REGISTRY
+from myapp import metrics
+from myapp.models import Room
+from myapp.room_state import RoomState
+from myapp.routing import websocket_urlpatterns
+from myapp.tasks import create_image
+
+application = URLRouter(websocket_urlpatterns)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class EventMetricsTest(TestCase):
+    async def test_observe_event_counts_queries_and_group_send(self):
+        queries = sample("ws_event_queries_sum", event="getState")
+        sends = sample("ws_event_channel_send_seconds_count", event="getState")
+
+        with metrics.observe_event("getState") as stats:
+            await sync_to_async(Room.objects.count)()
+            await sync_to_async(Room.objects.count)()
+            await get_channel_layer().group_send("metrics_test", {"type": "heartbeat"})
+
+        self.assertEqual(stats.queries, 2)
+        self.assertGreater(stats.channel_send, 0)
+        self.assertEqual(sample("ws_event_queries_sum", event="getState"), queries + 2)
+        self.assertEqual(sample("ws_event_channel_send_seconds_count", event="getState"), sends + 1)
+
+        # 이벤트 밖의 쿼리는 세지 않는다.
+        await sync_to_async(Room.objects.count)()
+        self.assertEqual(stats.queries, 2)
+
+    async def test_consumer_events_and_open_sockets(self):
+        cache.clear()
+        room = await sync_to_async(Room.objects.create)()
+        RoomState(room.id).mark_exists()
+        pings = sample("ws_event_duration_seconds_count", event="ping")
+        unknown = sample("ws_event_duration_seconds_count", event="unknown")
+        sockets = sample("ws_open_sockets")
+
+        communicator = WebsocketCommunicator(application, f"/ws/room/{room.id}/")
+        await communicator.connect()
+        self.assertEqual(sample("ws_open_sockets"), sockets + 1)
+        self.assertGreaterEqual(sample("ws_active_rooms"), 1)
+
+        await communicator.send_json_to({"event": "ping", "data": "ping"})
+        while (await communicator.receive_json_from()).get("event") != "pong":
+            pass
+        await communicator.send_json_to({"event": "somethingElse"})
+        await communicator.disconnect()
+
+        self.assertEqual(sample("ws_event_duration_seconds_count", event="ping"), pings + 1)
+        self.assertEqual(sample("ws_event_duration_seconds_count", event="unknown"), unknown + 1)
+        self.assertEqual(sample("ws_open_sockets"), sockets)
+
+    async def test_database_sync_to_async_wait_is_added_to_event(self):
+        with metrics.observe_event("getState") as stats:
+            count = await metrics.database_sync_to_async(Room.objects.count)()
+
+        self.assertEqual(count, 0)
+        self.assertEqual(stats.queries, 1)
+        self.assertGreater(stats.sync_wait, 0)
+
+    @mock.patch("myapp.tasks.upload_image_to_s3", return_value="images/cat.png")
+    @mock.patch("myapp.tasks.openai.Image.create")
+    def test_image_jobs_in_flight(self, image_create, upload):
+        cache.clear()
+        jobs = sample("image_jobs_in_flight")
+
+        def create(**kwargs):
+            # 이미지를 만드는 동안에만 올라간다.
+            self.assertEqual(sample("image_jobs_in_flight"), jobs + 1)
+            return {"data": [{"url": "https://example.com/cat.png"}]}
+
+        image_create.side_effect = create
+        create_image("a cat")
+        image_create.assert_called_once()
+        self.assertEqual(sample("image_jobs_in_flight"), jobs)
@@ -1,4 +1,7 @@
+from unittest import skipUnless
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from myapp.models import Room, SubRoom, Topic
 from django.utils import timezone
 
@@ -49,3 +52,98 @@ class TopicModelTest(TestCase):
         topic.delete()
         self.assertIsNotNone(topic.delete_at)
         self.assertLessEqual(topic.delete_at, timezone.now())
+
+
+class SubRoomRingTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create()
+
+    def ring(self):
+        first = SubRoom.get_first_subroom(self.room)
+        order = [first.id]
+        next_id = first.get_next_id()
+        while next_id != first.id:
+            order.append(next_id)
+            next_id = SubRoom.objects.get(id=next_id).get_next_id()
+        return order
+
+    def test_join_appends_to_ring(self):
+        subrooms = [SubRoom.add_subroom(self.room) for _ in range(3)]
+        self.assertEqual(self.ring(), [subroom.id for subroom in subrooms])
+        self.assertEqual([subroom.is_host for subroom in subrooms], [True, False, False])
+        self.assertEqual(subrooms[2].first_player, '플레이어 3')
+
+    def test_join_uses_constant_queries(self):
+        SubRoom.add_subroom(self.room)
+        with CaptureQueriesContext(connection) as second:
+            SubRoom.add_subroom(self.room)
+        for _ in range(2):
+            SubRoom.add_subroom(self.room)
+        with CaptureQueriesContext(connection) as fifth:
+            SubRoom.add_subroom(self.room)
+        self.assertEqual(len(second), len(fifth))
+
+    def test_join_full_room(self):
+        for _ in range(Room.MAX_PLAYERS):
+            SubRoom.add_subroom(self.room)
+        self.assertIsNone(SubRoom.add_subroom(self.room))
+
+    def test_leave_repairs_ring_and_promotes_one_host(self):
+        host, second, third = [SubRoom.add_subroom(self.room) for _ in range(3)]
+        host.delete_subroom()
+
+        self.assertEqual(self.ring(), [second.id, third.id])
+        hosts = SubRoom.objects.filter(room=self.room, is_host=True, delete_at=None)
+        self.assertEqual(list(hosts.values_list('id', flat=True)), [second.id])
+
+        third.refresh_from_db()
+        third.delete_subroom()
+        second.refresh_from_db()
+        self.assertEqual(second.get_next_id(), second.id)
+
+    def test_evict_repairs_ring_in_bulk(self):
+        host, second, third, fourth = [SubRoom.add_subroom(self.room) for _ in range(4)]
+
+        remaining = SubRoom.evict(self.room.id, [host.id, third.id])
+
+        self.assertEqual(remaining, [second.id, fourth.id])
+        self.assertEqual(self.ring(), [second.id, fourth.id])
+        hosts = SubRoom.objects.filter(room=self.room, is_host=True, delete_at=None)
+        self.assertEqual(list(hosts.values_list('id', flat=True)), [second.id])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN 형식은 SQLite 기준')
+class QueryPlanTest(TestCase):
+    # 자주 실행되는 쿼리가 (FK 인덱스 + 정렬이 아닌) 복합 인덱스를 타는지 확인한다.
+    def setUp(self):
+        self.room = Room.objects.create()
+        self.subroom = SubRoom.add_subroom(self.room)
+
+    def assertUsesIndex(self, queryset, index, sorted_by_index=True):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index}\b')
+        self.assertNotRegex(plan, r'\bSCAN myapp_')
+        if sorted_by_index:
+            self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_subroom_queries_use_index(self):
+        self.assertUsesIndex(
+            SubRoom.objects.filter(room=self.room, delete_at=None).order_by('created_at'),
+            'subroom_room_alive_idx',
+        )
+        self.assertUsesIndex(
+            SubRoom.objects.filter(room=self.room, delete_at=None).order_by('-created_at'),
+            'subroom_room_alive_idx',
+        )
+
+    def test_topic_queries_use_index(self):
+        topics = Topic.objects.filter(sub_room_id=self.subroom.id, delete_at=None)
+        self.assertUsesIndex(topics.order_by('-created_at'), 'topic_subroom_alive_idx')
+        room_topics = Topic.objects.filter(sub_room__room_id=self.room.id, delete_at=None)
+        self.assertUsesIndex(
+            room_topics.order_by('created_at'), 'topic_subroom_alive_idx', sorted_by_index=False
+        )
+
+    def test_purge_query_uses_index(self):
+        expired = Room.objects.filter(delete_at__lt=timezone.now())
+        self.assertUsesIndex(expired, 'room_delete_at_idx')
@@ -0,0 +1,48 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from myapp.rate_limit import InFlightLimit, RateLimiter
+
+
+class RateLimiterTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("myapp.rate_limit.time.time", return_value=125.0)
+    def test_limit_per_window(self, now):
+        limiter = RateLimiter("test", 2, 60)
+        self.assertEqual(limiter.acquire(), 0)
+        self.assertEqual(limiter.acquire(), 0)
+        # 다음 구간(180초)까지 기다려야 한다.
+        self.assertEqual(limiter.acquire(), 55.0)
+
+        now.return_value = 180.0
+        self.assertEqual(limiter.acquire(), 0)
+
+
+class InFlightLimitTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cap_and_release(self):
+        limit = InFlightLimit("room:1:images", 2, 60)
+        self.assertTrue(limit.acquire())
+        self.assertTrue(limit.acquire())
+        self.assertFalse(limit.acquire())
+
+        limit.release()
+        self.assertTrue(limit.acquire())
+
+    def test_release_after_expiry_does_not_go_negative(self):
+        limit = InFlightLimit("room:1:images", 2, 60)
+        limit.acquire()
+        # 작업 도중 키가 만료되고 다른 작업이 새로 잡은 경우
+        cache.delete(limit.key)
+        limit.acquire()
+
+        limit.release()
+        limit.release()
+        self.assertEqual(cache.get(limit.key, 0), 0)
+        self.assertTrue(limit.acquire())
+        self.assertTrue(limit.acquire())
+        self.assertFalse(limit.acquire())
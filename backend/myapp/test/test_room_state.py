@@ -0,0 +1,198 @@
+import asyncio
+import gc
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from myapp.models import Room, SubRoom, Topic
+from myapp.room_state import RoomState
+
+
+class RoomStateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.first = SubRoom.add_subroom(self.room)
+        self.second = SubRoom.add_subroom(self.room)
+        self.state = RoomState(self.room.id)
+
+    def test_players_are_served_from_cache(self):
+        players = async_to_sync(self.state.refresh_players)()
+        self.assertEqual(
+            [player["player_id"] for player in players], [self.first.id, self.second.id]
+        )
+
+        # 캐시에 올라간 뒤에는 DB를 다시 조회하지 않는다.
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(self.state.get_player_count)(), 2)
+            next_id = async_to_sync(self.state.get_next_player_id)
+            self.assertEqual(next_id(self.first.id), self.second.id)
+            self.assertEqual(next_id(self.second.id), self.first.id)
+
+    def test_local_state_is_shared_per_room(self):
+        state = RoomState.local(self.room.id)
+        self.assertIs(RoomState.local(str(self.room.id)), state)
+        state.current_round = 2
+        self.assertEqual(RoomState.local(self.room.id).current_round, 2)
+
+        # 쓰는 컨슈머가 없으면 사라진다.
+        del state
+        gc.collect()
+        self.assertEqual(RoomState.local(self.room.id).current_round, 0)
+
+    async def test_mark_complete_counts_each_player_once(self):
+        self.assertEqual(await self.state.mark_complete(1, self.first.id), 1)
+        self.assertEqual(await self.state.mark_complete(1, self.first.id), 1)
+        self.assertEqual(await self.state.mark_complete(1, self.second.id), 2)
+        self.assertEqual(await self.state.get_complete_num(2), 0)
+
+    async def test_stale_players(self):
+        # 기록이 없던 플레이어(second)는 처음 확인한 시점부터 잰다.
+        await self.state.touch(self.first.id)
+        self.assertEqual(await self.state.get_stale_players(30), [])
+
+        await cache.aset(self.state.key("seen", self.first.id), time.time() - 60)
+        self.assertEqual(await self.state.get_stale_players(30), [self.first.id])
+
+        self.assertEqual(await self.state.evict_players([self.first.id]), [self.second.id])
+        self.assertEqual(
+            await self.state.get_players(),
+            [{"player_id": self.second.id, "name": "플레이어 2", "isHost": True}],
+        )
+
+    async def test_round_complete_ignores_departed_players(self):
+        await self.state.refresh_players()
+        await self.state.mark_complete(1, self.first.id)
+        self.assertFalse(await self.state.is_round_complete(1))
+
+        await self.state.evict_players([self.second.id])
+        self.assertTrue(await self.state.is_round_complete(1))
+
+    async def test_claim_round_once(self):
+        claims = await asyncio.gather(*[self.state.claim_round(1) for _ in range(6)])
+        self.assertEqual(claims.count(True), 1)
+
+    def test_topic_write_through(self):
+        async_to_sync(self.state.add_topic)(self.first.id, 1, "고양이", self.first.id)
+        async_to_sync(self.state.change_title)(self.first.id, 1, "강아지")
+        async_to_sync(self.state.set_url)(self.first.id, 1, "https://example.com/dog.png")
+
+        with self.assertNumQueries(0):
+            topic = async_to_sync(self.state.get_topic)(self.first.id, 1)
+            url = async_to_sync(self.state.get_url)(self.first.id, 1)
+        self.assertEqual(topic["title"], "강아지")
+        self.assertEqual(url, "https://example.com/dog.png")
+        self.assertFalse(Topic.objects.exists())
+
+        # 쌓인 변경은 flush 한 번에 DB로 내려간다.
+        self.assertEqual(async_to_sync(self.state.flush_topics)(), 1)
+        saved = Topic.objects.get(sub_room=self.first)
+        self.assertEqual(saved.title, "강아지")
+        self.assertEqual(saved.url, "https://example.com/dog.png")
+        self.assertEqual(
+            async_to_sync(self.state.load_url)(self.first.id, 1), "https://example.com/dog.png"
+        )
+
+    def test_flush_batches_rounds_and_updates(self):
+        add_topic = async_to_sync(self.state.add_topic)
+        flush_topics = async_to_sync(self.state.flush_topics)
+        add_topic(self.first.id, 1, "고양이", self.first.id)
+        add_topic(self.second.id, 1, "사과", self.second.id)
+        add_topic(self.first.id, 2, "호랑이", self.second.id)
+        flush_topics()
+        self.assertEqual(Topic.objects.count(), 3)
+
+        # 변경이 없으면 DB를 건드리지 않는다.
+        with self.assertNumQueries(0):
+            self.assertEqual(flush_topics(), 0)
+
+        # 이미 저장된 주제는 INSERT 없이 한 번의 bulk_update로 고친다.
+        for title in ("강아지", "늑대", "여우"):
+            async_to_sync(self.state.change_title)(self.first.id, 1, title)
+        async_to_sync(self.state.set_url)(self.second.id, 1, "https://example.com/apple.png")
+        self.assertEqual(flush_topics(), 2)
+        self.assertEqual(Topic.objects.count(), 3)
+        self.assertEqual(
+            Topic.objects.get(sub_room=self.first, player_id=self.first.id).title, "여우"
+        )
+        self.assertEqual(
+            Topic.objects.get(sub_room=self.second).url, "https://example.com/apple.png"
+        )
+
+    def test_flush_checks_only_changed_topics(self):
+        add_topic = async_to_sync(self.state.add_topic)
+        flush_topics = async_to_sync(self.state.flush_topics)
+        add_topic(self.first.id, 1, "고양이", self.first.id)
+        add_topic(self.second.id, 1, "사과", self.second.id)
+        with mock.patch.object(RoomState, "get_all_slots") as get_all_slots:
+            self.assertEqual(flush_topics(), 2)
+        get_all_slots.assert_not_called()
+
+        # 변경 기록이 빠졌으면 방의 모든 주제를 확인한다.
+        async_to_sync(self.state.change_title)(self.first.id, 1, "강아지")
+        cache.delete(self.state.key("dirty_slot", cache.get(self.state.key("dirty"))))
+        self.assertEqual(flush_topics(), 1)
+        self.assertEqual(Topic.objects.get(sub_room=self.first).title, "강아지")
+
+    def test_flush_is_idempotent_without_bulk_returning(self):
+        add_topic = async_to_sync(self.state.add_topic)
+        flush_topics = async_to_sync(self.state.flush_topics)
+        # 플레이어가 나가 릴레이 순서가 바뀌면 같은 (SubRoom, 작성자) 주제가 여러 라운드에 생긴다.
+        add_topic(self.first.id, 1, "고양이", self.second.id)
+        add_topic(self.first.id, 2, "호랑이", self.second.id)
+        features = type(connection.features)
+        with mock.patch.object(features, "can_return_rows_from_bulk_insert", False):
+            # 새 주제가 몇 개든 INSERT 한 번과 id 조회 한 번이다. (+ SAVEPOINT / RELEASE)
+            with self.assertNumQueries(4):
+                flush_topics()
+
+            # 다른 프로세스가 같은 변경을 다시 써도 주제가 두 번 INSERT 되지 않는다.
+            topic_ids = [self.state.key("topic_id", self.first.id, round) for round in (1, 2)]
+            self.assertEqual(len(cache.get_many(topic_ids)), 2)
+            cache.delete_many(topic_ids + [self.state.key("flushed", self.first.id, 1)])
+            cache.delete(self.state.key("flushed"))
+            async_to_sync(self.state.change_title)(self.first.id, 1, "강아지")
+            flush_topics()
+
+        topics = Topic.objects.filter(sub_room=self.first).order_by("round")
+        self.assertEqual([topic.title for topic in topics], ["강아지", "호랑이"])
+        self.assertEqual(cache.get(self.state.key("topic_id", self.first.id, 1)), topics[0].id)
+
+    async def test_reset_game_clears_topics(self):
+        await self.state.add_topic(self.first.id, 1, "고양이", self.first.id)
+        await self.state.reset_game()
+        self.assertIsNone(await self.state.get_topic(self.first.id, 1))
+        self.assertTrue(await self.state.claim_round(1))
+        self.assertEqual(await self.state.get_round(), 1)
+
+    def test_results_are_built_in_two_queries(self):
+        add_topic = async_to_sync(self.state.add_topic)
+        add_topic(self.first.id, 1, "고양이", self.first.id)
+        add_topic(self.second.id, 1, "사과", self.second.id)
+        add_topic(self.first.id, 2, "호랑이", self.second.id)
+        async_to_sync(self.state.flush_topics)()
+
+        with self.assertNumQueries(2):
+            results = async_to_sync(self.state.get_results)()
+        with self.assertNumQueries(0):
+            async_to_sync(self.state.get_results)()
+
+        self.assertEqual(
+            results[self.first.id],
+            [
+                {"title": "고양이", "player_name": "플레이어 1", "img": None},
+                {"title": "호랑이", "player_name": "플레이어 2", "img": None},
+            ],
+        )
+        self.assertEqual(len(results[self.second.id]), 1)
+
+    def test_late_image_refreshes_results(self):
+        async_to_sync(self.state.add_topic)(self.first.id, 1, "고양이", self.first.id)
+        self.assertIsNone(async_to_sync(self.state.get_results)()[self.first.id][0]["img"])
+
+        # 결과를 먼저 조회한 뒤에 끝난 이미지도 다음 조회에 반영된다.
+        async_to_sync(self.state.set_url)(self.first.id, 1, "https://example.com/cat.png")
+        results = async_to_sync(self.state.get_results)()
+        self.assertEqual(results[self.first.id][0]["img"], "https://example.com/cat.png")
@@ -0,0 +1,264 @@
+import base64
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import boto3
+from celery.exceptions import Retry
+from celery.result import AsyncResult
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from myapp.models import Room, SubRoom, Topic
+from myapp.room_state import RoomState
+from myapp import image_cache
+from moto import mock_aws
+from myapp import tasks
+from myapp.rate_limit import InFlightLimit
+from myapp.tasks import (
+    clear_data,
+    create_image,
+    generate_round_images,
+    save_image_url,
+    upload_image_data_to_s3,
+    upload_image_to_s3,
+)
+
+
+class SaveImageUrlTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.sub_room = SubRoom.add_subroom(self.room)
+        self.state = RoomState(self.room.id)
+        async_to_sync(self.state.add_topic)(self.sub_room.id, 1, "고양이", self.sub_room.id)
+
+        self.channel_layer = get_channel_layer()
+        self.channel_name = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(self.state.group_name, self.channel_name)
+
+    def test_image_ready_is_pushed_to_room(self):
+        url = "https://example.com/cat.png"
+        save_image_url(url, self.room.id, self.sub_room.id, 1)
+
+        self.assertEqual(async_to_sync(self.state.get_url)(self.sub_room.id, 1), url)
+        async_to_sync(self.state.flush_topics)()
+        self.assertEqual(Topic.objects.get(sub_room=self.sub_room).url, url)
+
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(message["type"], "image_ready")
+        self.assertEqual(
+            message["message"], {"sub_room_id": self.sub_room.id, "round": 1, "url": url}
+        )
+
+    def test_result_for_changed_title_is_discarded(self):
+        async_to_sync(self.state.change_title)(self.sub_room.id, 1, "강아지")
+        save_image_url("https://example.com/cat.png", self.room.id, self.sub_room.id, 1, "고양이")
+
+        self.assertIsNone(async_to_sync(self.state.get_url)(self.sub_room.id, 1))
+        async_to_sync(self.state.flush_topics)()
+        self.assertIsNone(Topic.objects.get(sub_room=self.sub_room).url)
+
+    def test_generation_error_is_pushed_to_room(self):
+        save_image_url({"error": "rejected"}, self.room.id, self.sub_room.id, 1)
+
+        self.assertIsNone(async_to_sync(self.state.get_url)(self.sub_room.id, 1))
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(message["type"], "image_created_fail")
+
+    def test_prefetch_error_is_silent_until_round_ends(self):
+        async_to_sync(self.state.set_image_job)(self.sub_room.id, 1, "고양이", "prefetch")
+        tasks.image_pipeline_failed(
+            None, Exception("timeout"), None, self.room.id, self.sub_room.id, 1, True
+        )
+
+        # 라운드 중에는 알리지 않고, 라운드가 끝날 때 다시 만들도록 작업 기록만 지운다.
+        self.assertIsNone(async_to_sync(self.state.get_image_job)(self.sub_room.id, 1))
+        async_to_sync(self.channel_layer.group_send)(self.state.group_name, {"type": "marker"})
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(message["type"], "marker")
+
+        # 라운드 종료 작업이 이미 이 작업을 기다리고 있으면 알린다.
+        async_to_sync(self.state.claim_round)(1)
+        save_image_url({"error": "rejected"}, self.room.id, self.sub_room.id, 1, "고양이", True)
+        message = async_to_sync(self.channel_layer.receive)(self.channel_name)
+        self.assertEqual(message["type"], "image_created_fail")
+
+
+@mock.patch("myapp.tasks.image_pipeline")
+@mock.patch("myapp.tasks.group")
+class GenerateRoundImagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create()
+        self.state = RoomState(self.room.id)
+        self.sub_rooms = [SubRoom.add_subroom(self.room) for _ in range(3)]
+        for sub_room, title in zip(self.sub_rooms, ["고양이", "강아지", "사과"]):
+            async_to_sync(self.state.add_topic)(sub_room.id, 1, title, sub_room.id)
+
+        # 세 번째 플레이어는 제목을 내고 나갔다.
+        self.sub_rooms[2].delete_subroom()
+
+    @mock.patch("myapp.tasks.revoke_image_pipeline")
+    def test_room_images_are_started_once(self, revoke_image_pipeline, group, image_pipeline):
+        first, second, third = [sub_room.id for sub_room in self.sub_rooms]
+        group.return_value.apply_async.return_value.results = [
+            AsyncResult("item-1", parent=AsyncResult("create-1")),
+            AsyncResult("item-2"),
+        ]
+        # 첫 번째 주제는 미리 시작됐고, 두 번째는 예전 제목으로 시작됐다.
+        async_to_sync(self.state.set_image_job)(first, 1, "고양이", "prefetch")
+        async_to_sync(self.state.set_image_job)(second, 1, "호랑이", "stale")
+
+        task_ids = generate_round_images(self.room.id, 1)
+
+        self.assertEqual(task_ids, {first: "prefetch", second: "item-1", third: "item-2"})
+        self.assertEqual(
+            sorted(call.args for call in image_pipeline.call_args_list),
+            [(self.room.id, second, 1, "강아지"), (self.room.id, third, 1, "사과")],
+        )
+
+        # 예전 제목으로 시작한 작업만 취소한다.
+        revoke_image_pipeline.assert_called_once_with(
+            {"title": "호랑이", "task_id": "stale", "task_ids": ["stale"]}
+        )
+        # 새 작업은 다음에 취소할 수 있도록 체인의 모든 단계 id를 남긴다.
+        job = async_to_sync(self.state.get_image_job)(second, 1)
+        self.assertEqual(job["task_ids"], ["item-1", "create-1"])
+
+        # 재시도해도 이미 보낸 작업은 다시 보내지 않는다.
+        self.assertEqual(generate_round_images(self.room.id, 1), task_ids)
+        self.assertEqual(group.call_count, 1)
+
+
+class ClearDataTest(TestCase):
+    def make_room(self, created_at=None, delete_at=None):
+        room = Room.objects.create()
+        first = SubRoom.add_subroom(room)
+        second = SubRoom.add_subroom(room)
+        Topic.objects.create(title="고양이", player_id=first.id, sub_room=first)
+        Topic.objects.create(title="사과", player_id=second.id, sub_room=second)
+        Room.objects.filter(id=room.id).update(
+            created_at=created_at or timezone.now(), delete_at=delete_at
+        )
+        return room
+
+    def test_purges_expired_rooms_in_batches(self):
+        now = timezone.now()
+        expired = [self.make_room(delete_at=now - timedelta(hours=2)) for _ in range(3)]
+        stale = self.make_room(created_at=now - timedelta(days=2))
+        recently_deleted = self.make_room(delete_at=now - timedelta(minutes=5))
+        active = self.make_room()
+
+        result = clear_data(batch_size=2)
+
+        self.assertEqual(result["rooms"], 4)
+        self.assertEqual(result["sub_rooms"], 8)
+        self.assertEqual(result["topics"], 8)
+        self.assertEqual(result["batches"], 2)
+        self.assertFalse(
+            Room.objects.filter(id__in=[room.id for room in expired + [stale]]).exists()
+        )
+        self.assertEqual(
+            set(Room.objects.values_list("id", flat=True)), {recently_deleted.id, active.id}
+        )
+        self.assertEqual(SubRoom.objects.count(), 4)
+        self.assertEqual(Topic.objects.count(), 4)
+
+
+@mock.patch("myapp.tasks.upload_image_to_s3", return_value="images/image_1.png")
+@mock.patch(
+    "myapp.tasks.openai.Image.create", return_value={"data": [{"url": "https://openai/1.png"}]}
+)
+class CreateImageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_prompt_skips_generation(self, image_create, upload):
+        first = create_image("A  Cat")
+        second = create_image("a cat")
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith("/images/image_1.png"))
+        self.assertEqual(image_create.call_count, 1)
+        self.assertEqual(upload.call_count, 1)
+        self.assertEqual(image_cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_room_can_opt_out(self, image_create, upload):
+        room = Room.objects.create(image_cache=False)
+        create_image("a cat", room_id=room.id)
+        create_image("a cat", room_id=room.id)
+
+        self.assertEqual(image_create.call_count, 2)
+        self.assertEqual(image_cache.stats(), {"hits": 0, "misses": 0})
+
+    @override_settings(ROOM_IMAGE_IN_FLIGHT=1)
+    def test_room_in_flight_cap_defers_generation(self, image_create, upload):
+        room = Room.objects.create()
+        InFlightLimit("room:%s:images" % room.id, 1, 60).acquire()
+
+        # 방 한도에 막히면 전체 요청 한도는 쓰지 않는다.
+        with mock.patch.object(tasks.image_rate_limiter, "acquire") as acquire:
+            with self.assertRaises(Retry):
+                create_image("a cat", room_id=room.id)
+        acquire.assert_not_called()
+        image_create.assert_not_called()
+
+    def test_rate_limit_defers_generation(self, image_create, upload):
+        with mock.patch.object(tasks.image_rate_limiter, "limit", 1):
+            create_image("a cat")
+            with self.assertRaises(Retry):
+                create_image("a dog")
+        self.assertEqual(image_create.call_count, 1)
+
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(AWS_STORAGE_BUCKET_NAME="test-bucket", AWS_S3_REGION_NAME="us-east-1")
+class UploadImageTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.image_url = "http://127.0.0.1:%d/image.png" % self.server.server_port
+
+        self.aws = mock_aws()
+        self.aws.start()
+        tasks._s3_client = None
+        self.s3 = boto3.client("s3", region_name="us-east-1")
+        self.s3.create_bucket(Bucket="test-bucket")
+
+    def tearDown(self):
+        tasks._s3_client = None
+        self.aws.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_object(self, key):
+        return self.s3.get_object(Bucket="test-bucket", Key=key)
+
+    def test_image_is_streamed_to_s3(self):
+        key = upload_image_to_s3(self.image_url, "image")
+
+        self.assertTrue(key.startswith("images/image_"))
+        uploaded = self.get_object(key)
+        self.assertEqual(uploaded["ContentType"], "image/png")
+        self.assertEqual(uploaded["Body"].read(), PNG)
+
+    def test_b64_image_is_uploaded_without_download(self):
+        key = upload_image_data_to_s3(base64.b64encode(PNG).decode(), "image")
+        self.assertEqual(self.get_object(key)["Body"].read(), PNG)
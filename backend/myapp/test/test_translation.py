@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from myapp import translation
+from myapp.translation import TranslationError, Translator
+
+
+# Papago를 흉내 내는 로컬 서버: 받은 문장을 대문자로 돌려준다.
+class StubPapagoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        text = parse_qs(self.rfile.read(length).decode())["text"][0]
+        self.server.requests.append(text)
+
+        if "실패" in text.split("\n"):
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        body = json.dumps({"message": {"result": {"translatedText": text.upper()}}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TranslatorTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubPapagoHandler)
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.requests.clear()
+
+    def make_translator(self, window):
+        with override_settings(PAPAGO_URL=self.url, TRANSLATION_BATCH_WINDOW=window):
+            return Translator()
+
+    def test_results_are_cached(self):
+        translator = self.make_translator(0)
+        self.assertEqual(translator.translate("cat"), "CAT")
+        self.assertEqual(translator.translate("cat"), "CAT")
+        self.assertEqual(self.server.requests, ["cat"])
+
+        # 다른 프로세스(새 Translator)도 공유 캐시에서 바로 꺼낸다.
+        self.assertEqual(self.make_translator(0).cached("cat"), "CAT")
+
+    def test_concurrent_titles_are_batched(self):
+        translator = self.make_translator(0.2)
+        results = {}
+
+        def translate(text):
+            results[text] = translator.translate(text)
+
+        threads = [
+            threading.Thread(target=translate, args=(text,)) for text in ["cat", "dog", "cat"]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {"cat": "CAT", "dog": "DOG"})
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(sorted(self.server.requests[0].split("\n")), ["cat", "dog"])
+
+    def test_failure_raises(self):
+        translator = self.make_translator(0)
+        with self.assertRaises(TranslationError):
+            translator.translate("실패")
+
+    def test_failed_batch_falls_back_to_each_title(self):
+        translator = self.make_translator(0.2)
+        results = {}
+
+        def translate(text):
+            try:
+                results[text] = translator.translate(text)
+            except TranslationError as e:
+                results[text] = e
+
+        threads = [threading.Thread(target=translate, args=(text,)) for text in ["cat", "실패"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 한 제목 때문에 묶음 요청이 실패해도 나머지 제목은 번역된다.
+        self.assertEqual(results["cat"], "CAT")
+        self.assertIsInstance(results["실패"], TranslationError)
+
+    def test_single_task_workers_do_not_wait_for_batch(self):
+        try:
+            translation.configure_worker("prefork", 8)
+            self.assertEqual(self.make_translator(0.2).window, 0)
+            translation.configure_worker("gevent", 1)
+            self.assertEqual(self.make_translator(0.2).window, 0)
+            translation.configure_worker("gevent", 100)
+            self.assertEqual(self.make_translator(0.2).window, 0.2)
+        finally:
+            translation.batching = True
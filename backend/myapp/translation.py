@@ -0,0 +1,181 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from celery.concurrency import get_implementation
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+
+class TranslationError(Exception):
+    pass
+
+
+# 묶음 요청은 한 프로세스에서 여러 태스크가 동시에 번역할 때(gevent/eventlet/threads 풀)만 도움이 된다.
+# prefork/solo 풀이나 --concurrency=1 이면 프로세스마다 태스크가 하나씩 실행되어
+# 묶을 요청이 없으므로 기다리지 않고 바로 요청한다. (config/celery.py에서 워커 시작 때 설정)
+SINGLE_TASK_POOLS = ("prefork", "solo")
+batching = True
+
+
+def configure_worker(pool, concurrency):
+    global batching
+    single_task = get_implementation(pool) in map(get_implementation, SINGLE_TASK_POOLS)
+    batching = concurrency > 1 and not single_task
+
+
+# Papago ko -> en 번역 서비스.
+# - 프로세스 내 LRU + 캐시(Redis) 두 단계로 번역 결과를 재사용한다.
+# - 연결을 재사용하는 requests.Session 하나로 요청한다.
+# - 짧은 시간(TRANSLATION_BATCH_WINDOW) 안에 들어온 제목들을 줄바꿈으로 묶어 한 번에 요청한다.
+class Translator:
+    def __init__(self):
+        self.url = settings.PAPAGO_URL
+        self.window = settings.TRANSLATION_BATCH_WINDOW if batching else 0
+        self.max_batch = settings.TRANSLATION_BATCH_SIZE
+        self.lru_size = settings.TRANSLATION_LRU_SIZE
+        self.timeout = settings.TRANSLATION_CACHE_TIMEOUT
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.worker = None
+        self.session = None
+
+    def translate(self, text):
+        translated = self.cached(text)
+        if translated is not None:
+            return translated
+
+        if self.window <= 0:
+            translated = self.request_many([text])[0]
+        else:
+            translated = self.submit(text).result()
+        self.remember(text, translated)
+        return translated
+
+    # 캐시에 있으면 바로 반환 (없으면 None)
+    def cached(self, text):
+        with self.lock:
+            if text in self.lru:
+                self.lru.move_to_end(text)
+                return self.lru[text]
+
+        translated = cache.get(self.cache_key(text))
+        if translated is not None:
+            self.remember_local(text, translated)
+        return translated
+
+    def remember(self, text, translated):
+        cache.set(self.cache_key(text), translated, self.timeout)
+        self.remember_local(text, translated)
+
+    def remember_local(self, text, translated):
+        with self.lock:
+            self.lru[text] = translated
+            self.lru.move_to_end(text)
+            while len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+    @staticmethod
+    def cache_key(text):
+        return "translation:ko:en:" + hashlib.sha256(text.encode()).hexdigest()
+
+    # 마이크로 배치
+    def submit(self, text):
+        future = Future()
+        self.pending.put((text, future))
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # 요청은 별도 스레드에서 보내, 응답을 기다리는 동안에도 다음 배치를 모은다.
+            threading.Thread(target=self.flush, args=(batch,), daemon=True).start()
+
+    def flush(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            results = dict(zip(texts, self.request_many(texts)))
+        except Exception:
+            # 묶음 요청이 실패하면 하나씩 다시 요청해서 실패한 제목만 실패시킨다.
+            results = {}
+            for text in texts:
+                try:
+                    results[text] = self.request_many([text])[0]
+                except Exception as e:
+                    results[text] = e
+
+        for text, future in batch:
+            if isinstance(results[text], Exception):
+                future.set_exception(results[text])
+            else:
+                future.set_result(results[text])
+
+    # Papago 요청
+    def request_many(self, texts):
+        lines = [" ".join(text.splitlines()) for text in texts]
+        if len(lines) > 1:
+            translated = self.request("\n".join(lines)).split("\n")
+            if len(translated) == len(lines):
+                return [line.strip() for line in translated]
+
+        # 줄 수가 맞지 않으면 하나씩 요청한다.
+        return [self.request(line) for line in lines]
+
+    def request(self, text):
+        headers = {
+            "X-Naver-Client-Id": os.getenv("NAVER_CLIENT_ID"),
+            "X-Naver-Client-Secret": os.getenv("NAVER_CLIENT_SECRET"),
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+        }
+
+        data = {
+            "source": "ko",
+            "target": "en",
+            "text": text,
+        }
+
+        response = self.get_session().post(self.url, headers=headers, data=data, timeout=10)
+        if response.status_code != 200:
+            # 처리 실패 시 예외 처리 등을 수행할 수 있습니다.
+            raise TranslationError("Translation failed")
+
+        return response.json()["message"]["result"]["translatedText"]
+
+    def get_session(self):
+        # 프로세스 fork 이후 처음 사용할 때 만든다.
+        if self.session is None:
+            session = requests.Session()
+            pool_size = settings.EXTERNAL_API_POOL_SIZE
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            self.session = session
+        return self.session
+
+
+_translator = None
+
+
+def get_translator():
+    global _translator
+    if _translator is None:
+        _translator = Translator()
+    return _translator
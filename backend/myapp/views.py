@@ -3,6 +3,7 @@ import pika
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import Room
+from .room_state import RoomState
 
 
 # Create your views here.
@@ -27,11 +28,15 @@ def send_message(request):
 @api_view(["POST"])
 def add_room(request):
     if request.method == "POST":
-        room = Room.objects.create()  # 방 생성
+        # image_cache: false 로 보내면 이 방은 이미지 캐시를 쓰지 않고 항상 새로 생성한다.
+        image_cache = request.data.get("image_cache", True) not in (False, "false", "0")
+        room = Room.objects.create(image_cache=image_cache)
+        RoomState(room.id).mark_exists()  # 웹소켓 입장 시 DB 조회 없이 확인
         data = {
             "message": "방 생성 완료!",
             "result": {
                 "room_id": room.id,
+                "image_cache": room.image_cache,
                 "created_at": room.created_at,
                 "update_at": room.update_at,
             },